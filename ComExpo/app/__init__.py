@@ -1,20 +1,38 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-import os
-from datetime import timedelta
+from app.db_routing import RoutingSession, REPLICA_BIND
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 
+def engine_options(config, url):
+    """SQLAlchemy create_engine() options for one database URL"""
+    if not url or url.startswith('sqlite'):
+        return {}
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if url.startswith('postgresql') and config['DB_STATEMENT_TIMEOUT_MS']:
+        options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
 def create_app():
     app = Flask(__name__)
     
-    # Load configuration
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-    app.config['REMEMBER_COOKIE_DURATION'] = timedelta(days=30)
+    # Load configuration (app/config.py, values come from the environment)
+    from app.config import Config
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config, app.config['SQLALCHEMY_DATABASE_URI'])
+    if app.config['DATABASE_REPLICA_URL']:
+        app.config['SQLALCHEMY_BINDS'] = {
+            REPLICA_BIND: dict(engine_options(app.config, app.config['DATABASE_REPLICA_URL']),
+                               url=app.config['DATABASE_REPLICA_URL'])
+        }
 
     @app.template_filter('dateformat')
     def dateformat(value, format='%d %B %Y'):
@@ -30,54 +48,61 @@ def create_app():
     login_manager.login_view = 'main.login'
     login_manager.login_message = 'Please log in to access this page.'
     login_manager.login_message_category = 'info'
+
+    from app.cache import user_cache, fragment_cache, feed_cache, cached_row
+    user_cache.max_size = app.config['USER_CACHE_SIZE']
+    user_cache.ttl = app.config['USER_CACHE_TTL']
+    fragment_cache.max_bytes = app.config['FRAGMENT_CACHE_MAX_BYTES']
+    feed_cache.max_bytes = app.config['CALENDAR_CACHE_MAX_BYTES']
+    app.add_template_global(cached_row)
+
+    from app.events import broker
+    broker.max_streams = app.config['SSE_MAX_STREAMS']
+
+    from app.passwords import password_hasher, login_throttle
+    password_hasher.configure(app.config['PASSWORD_HASH_METHOD'], app.config['PASSWORD_HASH_WORKERS'],
+                              app.config['PASSWORD_HASH_MAX_PENDING'], timeout=10)
+    login_throttle.max_per_user = app.config['LOGIN_MAX_FAILURES_PER_USER']
+    login_throttle.max_per_ip = app.config['LOGIN_MAX_FAILURES_PER_IP']
+    login_throttle.window = app.config['LOGIN_THROTTLE_WINDOW']
     
     # Register blueprints
     from app.routes.main import main_bp
     from app.routes.booking import booking_bp
     from app.routes.approval import approval_bp
     from app.routes.history import history_bp
+    from app.routes.api import api_bp
+    from app.routes.export import export_bp
+    from app.routes.calendar import calendar_bp, calendar_feed_url
     
     app.register_blueprint(main_bp)
     app.register_blueprint(booking_bp, url_prefix='/booking')
     app.register_blueprint(approval_bp, url_prefix='/approval')
     app.register_blueprint(history_bp, url_prefix='/history')
+    app.register_blueprint(api_bp, url_prefix='/api')
+    app.register_blueprint(export_bp, url_prefix='/export')
+    app.register_blueprint(calendar_bp, url_prefix='/calendar')
+    app.add_template_global(calendar_feed_url)
+
+    # Fingerprinted/resized static files (flask build-assets) and their template helpers
+    from app.assets import init_assets
+    init_assets(app)
+
+    # CLI commands and background tasks
+    from app.commands import register_commands
+    from app.sweeper import start_sweeper
+    from app.notifications import start_notifier
+
+    register_commands(app)
+
+    # Request/SQL/template timing and the /metrics endpoint
+    from app.metrics import init_metrics
+    init_metrics(app)
 
-    # --- START NEW CODE ---
-    # This block ensures tables are created when the app starts
-    def seed_database():
-        from app.models import Room
+    @app.before_request
+    def start_background_tasks():
+        # Started on the first request so each gunicorn worker gets its own thread
+        start_sweeper(app)
+        start_notifier(app)
 
-        # DATA ENTRY: TYPE YOUR DATA HERE
-        rooms_to_seed = [
-            Room(room_id='CPE-1116', chair=42, projector=True, air_conditioner=2, computer=False),
-            Room(room_id='CPE-1115', chair=81, projector=True, air_conditioner=4, computer=False),
-            Room(room_id='CPE-1121', chair=84, projector=True, air_conditioner=4, computer=False),
-            Room(room_id='CPE-1114', chair=57, projector=True, air_conditioner=4, computer=False),
-            Room(room_id='CPE-1113', chair=51, projector=True, air_conditioner=4, computer=True),
-            Room(room_id='CPE-1112', chair=52, projector=True, air_conditioner=4, computer=True),
-            # Add as many as you want...
-        ]
-        print("--- STARTING DATABASE SEED CHECK ---")
-        added_count = 0
-        
-        for room_data in rooms_to_seed:
-            # Check if this SPECIFIC room_id exists
-            existing_room = Room.query.get(room_data.room_id)
-            
-            if existing_room:
-                print(f"   [SKIP] Room {room_data.room_id} already exists.")
-            else:
-                print(f"   [ADD]  Adding new room: {room_data.room_id}")
-                db.session.add(room_data)
-                added_count += 1
-        
-        if added_count > 0:
-            try:
-                db.session.commit()
-                print(f"--- SUCCESS: Added {added_count} new rooms! ---")
-            except Exception as e:
-                db.session.rollback()
-                print(f"--- ERROR: Could not save to DB: {e} ---")
-        else:
-            print("--- NO CHANGES: Database is already up to date. ---")
     return app
@@ -0,0 +1,275 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+from markupsafe import Markup, escape
+from flask import current_app, request, send_from_directory, url_for
+
+BUILD_DIR = 'build'
+MANIFEST_NAME = 'manifest.json'
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+TEXT_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt')
+IMAGE_WIDTHS = (160, 320, 640, 1280)
+# Best first: <picture> lists sources in this order and the browser takes the first it supports
+IMAGE_FORMATS = ('avif', 'webp')
+# AVIF's quality scale runs high: this much lower looks about like WebP/JPEG at `quality`
+AVIF_QUALITY_OFFSET = 15
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Content-Encoding -> suffix of the pre-compressed copy, preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _hashed_name(path, data, suffix='', ext=None):
+    """'images/room.jpg' -> 'build/images/room-640w.<hash>.webp' style names"""
+    stem, source_ext = os.path.splitext(path)
+    return f'{BUILD_DIR}/{stem}{suffix}.{_digest(data)}{ext or source_ext}'
+
+
+def _write(static_folder, name, data):
+    target = os.path.join(static_folder, name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+        f.write(data)
+    return name
+
+
+def _sources(static_folder):
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder:
+            dirs[:] = [d for d in dirs if d != BUILD_DIR]
+        for filename in sorted(files):
+            path = os.path.relpath(os.path.join(root, filename), static_folder)
+            yield path.replace(os.sep, '/')
+
+
+def _precompress(static_folder, name, data, brotli):
+    """Write name.gz (and name.br when brotli is installed) next to name; returns the encodings written"""
+    written = []
+    if brotli is not None:
+        _write(static_folder, name + '.br', brotli.compress(data, quality=11))
+        written.append('br')
+    _write(static_folder, name + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    written.append('gzip')
+    return written
+
+
+def _image_variants(static_folder, path, data, widths, quality, avif):
+    """
+    Resized copies of one image: every width in `widths` below its own width
+    plus the full width, in each of IMAGE_FORMATS and in the original format
+    (for browsers without WebP). Returns the manifest fields for the image.
+    """
+    from io import BytesIO
+    from PIL import Image
+
+    with Image.open(BytesIO(data)) as image:
+        image.load()
+    # Pillow reports some camera JPEGs as MPO
+    source_format = 'jpeg' if image.format == 'MPO' else image.format.lower()
+    sizes = sorted({w for w in widths if w < image.width} | {image.width})
+    variants = {}
+    for width in sizes:
+        height = round(image.height * width / image.width)
+        resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+        if resized.mode not in ('RGB', 'RGBA'):
+            resized = resized.convert('RGBA' if 'transparency' in resized.info else 'RGB')
+        for fmt in IMAGE_FORMATS + (source_format,):
+            if fmt == 'avif' and not avif:
+                continue
+            options = {'quality': quality - AVIF_QUALITY_OFFSET if fmt == 'avif' else quality}
+            if fmt == 'jpeg':
+                resized = resized.convert('RGB')
+                options.update(optimize=True, progressive=True)
+            elif fmt == 'png':
+                options = {'optimize': True}
+            buffer = BytesIO()
+            resized.save(buffer, fmt.upper(), **options)
+            ext = os.path.splitext(path)[1] if fmt == source_format else f'.{fmt}'
+            name = _hashed_name(path, buffer.getvalue(), suffix=f'-{width}w', ext=ext)
+            variants.setdefault(fmt, {})[str(width)] = _write(static_folder, name, buffer.getvalue())
+    return {'width': image.width, 'height': image.height, 'format': source_format, 'variants': variants}
+
+
+def build_assets(static_folder, widths=IMAGE_WIDTHS, quality=70, progress=None):
+    """
+    Fingerprint everything under static/ into static/build/ and write its manifest
+    Each file is copied as name.<content hash>.ext, images also get resized
+    WebP/AVIF/original-format variants (Pillow) and text files .br/.gz copies.
+    Old builds are left in place so pages cached before a deploy still load.
+    Returns the manifest: {source path: {'file': ..., 'variants': ..., ...}}.
+    """
+    try:
+        from PIL import features
+    except ImportError:
+        raise RuntimeError('Pillow is required to build image variants (pip install Pillow)')
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    avif = features.check('avif')
+
+    manifest = {}
+    for path in _sources(static_folder):
+        with open(os.path.join(static_folder, path), 'rb') as f:
+            data = f.read()
+        entry = {'file': _write(static_folder, _hashed_name(path, data), data)}
+        ext = os.path.splitext(path)[1].lower()
+        if ext in IMAGE_EXTENSIONS:
+            entry.update(_image_variants(static_folder, path, data, widths, quality, avif))
+        elif ext in TEXT_EXTENSIONS:
+            entry['encodings'] = _precompress(static_folder, entry['file'], data, brotli)
+        manifest[path] = entry
+        if progress:
+            progress(path, entry)
+
+    _write(static_folder, f'{BUILD_DIR}/{MANIFEST_NAME}',
+           json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+class AssetManifest:
+    """
+    static/build/manifest.json, loaded once per process
+    With auto_reload (debug) the file is re-read when its mtime changes, so
+    `flask build-assets` shows up without a restart. Without a manifest every
+    lookup misses and the helpers fall back to the plain static files.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.path = None
+        self.auto_reload = False
+        self._mtime = None
+        self._entries = {}
+        self._encodings = {}  # fingerprinted file -> pre-compressed encodings
+
+    def load(self, path):
+        with self._lock:
+            self.path = path
+            self._mtime = None
+            self._entries = {}
+            self._encodings = {}
+        self._refresh()
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except (OSError, TypeError):
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.path, encoding='utf-8') as f:
+            entries = json.load(f)
+        encodings = {entry['file']: tuple(entry['encodings']) for entry in entries.values() if entry.get('encodings')}
+        with self._lock:
+            self._mtime, self._entries, self._encodings = mtime, entries, encodings
+
+    def get(self, filename):
+        if self.auto_reload:
+            self._refresh()
+        return self._entries.get(filename)
+
+    def encodings(self, filename):
+        return self._encodings.get(filename, ())
+
+
+manifest = AssetManifest()
+
+
+def _variant(entry, fmt, width):
+    """Smallest variant at least `width` wide (the largest if none is), None without variants"""
+    sizes = entry.get('variants', {}).get(fmt)
+    if not sizes:
+        return None
+    widths = sorted(int(w) for w in sizes)
+    chosen = next((w for w in widths if w >= width), widths[-1]) if width else widths[-1]
+    return sizes[str(chosen)]
+
+
+def asset_url(filename, width=None, format=None, **values):
+    """
+    url_for('static', filename=...) for the fingerprinted build of a file
+    For images, width picks the smallest resized variant covering it and
+    format ('webp', 'avif') the encoding. Files missing from the manifest
+    (no build yet, new uploads) get the plain static URL.
+    """
+    entry = manifest.get(filename)
+    if entry is not None:
+        filename = _variant(entry, format or entry.get('format'), width) or entry['file']
+    return url_for('static', filename=filename, **values)
+
+
+def picture(filename, alt, width=None, sizes=None, **attrs):
+    """
+    <picture> for a static image: AVIF/WebP sources with every width in
+    their srcset, and an <img> in the original format sized for `width`
+    (CSS pixels of the slot; srcset covers denser screens). Extra keyword
+    arguments become attributes of the <img>; loading defaults to lazy.
+    """
+    entry = manifest.get(filename)
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    sizes = sizes or (f'{width}px' if width else '100vw')
+
+    def srcset(fmt):
+        return ', '.join(f"{url_for('static', filename=name)} {w}w"
+                         for w, name in sorted(entry['variants'][fmt].items(), key=lambda item: int(item[0])))
+
+    parts = ['<picture>']
+    if entry is not None and entry.get('variants'):
+        for fmt in IMAGE_FORMATS:
+            if fmt in entry['variants']:
+                parts.append(f'<source type="image/{fmt}" srcset="{escape(srcset(fmt))}" sizes="{escape(sizes)}">')
+        if entry['format'] in entry['variants']:
+            attrs.setdefault('srcset', srcset(entry['format']))
+            attrs.setdefault('sizes', sizes)
+        attrs.setdefault('width', entry['width'])
+        attrs.setdefault('height', entry['height'])
+    attrs = ''.join(f' {name}="{escape(value)}"' for name, value in attrs.items() if value is not None)
+    parts.append(f'<img src="{escape(asset_url(filename, width=width))}" alt="{escape(alt)}"{attrs}>')
+    parts.append('</picture>')
+    return Markup(''.join(parts))
+
+
+def _accepted_encoding(filename):
+    for encoding, suffix in ENCODINGS:
+        if encoding in manifest.encodings(filename) and request.accept_encodings[encoding]:
+            return encoding, suffix
+    return None, None
+
+
+def send_static(filename):
+    """
+    The app's static view: build/ files are served with far-future immutable
+    caching (their names change with their content) and, for text assets, as
+    the pre-compressed .br/.gz copy the client accepts. Other files as usual.
+    """
+    if not filename.startswith(BUILD_DIR + '/'):
+        return current_app.send_static_file(filename)
+
+    encoding, suffix = _accepted_encoding(filename)
+    if encoding:
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(current_app.static_folder, filename + suffix, mimetype=mimetype,
+                                       max_age=IMMUTABLE_MAX_AGE)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_from_directory(current_app.static_folder, filename, max_age=IMMUTABLE_MAX_AGE)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+
+def init_assets(app):
+    """Load the asset manifest, add the template helpers and take over the static view"""
+    manifest.load(os.path.join(app.static_folder, BUILD_DIR, MANIFEST_NAME))
+    manifest.auto_reload = app.debug
+    app.add_template_global(asset_url)
+    app.add_template_global(picture)
+    app.view_functions['static'] = send_static
@@ -17,7 +17,7 @@ def login_required_role(*roles):
             
             if current_user.role not in roles:
                 flash('You do not have permission to access this page.', 'danger') 
-                return redirect(url_for('main.dashboard'))
+                return redirect(url_for('main.home'))
             
             return f(*args, **kwargs)
         return decorated_function
@@ -0,0 +1,214 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from app.models import Reserve
+
+# One slot band on a room's day: state is 'free', 'pending' or 'booked'
+Band = namedtuple('Band', ['start', 'end', 'state'])
+
+# Per-process cache: date -> (built_at, {room_id: [Band, ...]})
+_cache = {}
+_cache_lock = threading.Lock()
+MAX_CACHED_DAYS = 64
+
+
+def build_bands(day_start, day_end, intervals):
+    """
+    Turn one room's (start, end, status) intervals into free/pending/booked bands
+    Approved beats Pending; adjacent bands with the same state are merged.
+    """
+    # Sweep over interval edges keeping a count of open approved/pending bookings
+    edges = []
+    for start, end, status in intervals:
+        start = max(start, day_start)
+        end = min(end, day_end)
+        if start >= end:
+            continue
+        kind = 'booked' if status == 'Approved' else 'pending'
+        edges.append((start, 1, kind))
+        edges.append((end, -1, kind))
+    edges.sort(key=lambda e: e[0])
+
+    bands = []
+    open_count = {'booked': 0, 'pending': 0}
+    cursor = day_start
+    i = 0
+    while i < len(edges):
+        at = edges[i][0]
+        if at > cursor:
+            _append_band(bands, cursor, at, _state(open_count))
+            cursor = at
+        # Apply every edge at this instant before emitting the next band
+        while i < len(edges) and edges[i][0] == at:
+            open_count[edges[i][2]] += edges[i][1]
+            i += 1
+    if cursor < day_end:
+        _append_band(bands, cursor, day_end, _state(open_count))
+    return bands
+
+
+def _state(open_count):
+    if open_count['booked']:
+        return 'booked'
+    if open_count['pending']:
+        return 'pending'
+    return 'free'
+
+
+def _append_band(bands, start, end, state):
+    if bands and bands[-1].state == state and bands[-1].end == start:
+        bands[-1] = Band(bands[-1].start, end, state)
+    else:
+        bands.append(Band(start, end, state))
+
+
+def _load_day(day):
+    """ONE query for every Pending/Approved interval touching the day"""
+    from app.cache import room_catalog
+    from app.utils import overlaps
+
+    day_start = datetime.combine(day, datetime.min.time())
+    day_end = day_start + timedelta(days=1)
+
+    rows = db.session.query(
+        Reserve.room_id, Reserve.start_time, Reserve.end_time, Reserve.status
+    ).filter(
+        Reserve.status.in_(['Pending', 'Approved']),
+        overlaps(day_start, day_end)
+    ).order_by(Reserve.room_id, Reserve.start_time).all()
+
+    intervals = {}
+    for room_id, start, end, status in rows:
+        intervals.setdefault(room_id, []).append((start, end, status))
+
+    room_ids = room_catalog.ids()
+    return {
+        room_id: build_bands(day_start, day_end, intervals.get(room_id, []))
+        for room_id in room_ids
+    }
+
+
+def get_day_availability(day, ttl=60):
+    """
+    Get {room_id: [Band, ...]} for every room on a date
+    Served from the per-process cache; rebuilt after a write that touches
+    the date (see mark_dirty) or after ttl seconds, which bounds staleness
+    from writes made in other worker processes.
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(day)
+    if entry and now - entry[0] < ttl:
+        return entry[1]
+
+    grid = _load_day(day)
+    with _cache_lock:
+        if len(_cache) >= MAX_CACHED_DAYS:
+            oldest = min(_cache, key=lambda d: _cache[d][0])
+            del _cache[oldest]
+        _cache[day] = (now, grid)
+    return grid
+
+
+def invalidate(days=None):
+    """Drop cached days (all of them when days is None)"""
+    with _cache_lock:
+        if days is None:
+            _cache.clear()
+        else:
+            for day in days:
+                _cache.pop(day, None)
+
+
+def mark_dirty(start_time, end_time):
+    """
+    Remember that a reservation spanning start_time..end_time changed
+    The affected days are invalidated when the session commits.
+    """
+    days = db.session.info.setdefault('availability_dirty', set())
+    day = start_time.date()
+    while day <= end_time.date():
+        days.add(day)
+        day += timedelta(days=1)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    days = session.info.pop('availability_dirty', None)
+    if days:
+        invalidate(days)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('availability_dirty', None)
+
+
+# --- Room search ---
+
+Slot = namedtuple('Slot', ['room', 'start', 'end', 'pending'])
+
+
+def _earliest_slot(bands, duration):
+    """
+    Earliest start in bands where duration fits without touching a booked band
+    Returns (start, overlaps_pending) or None.
+    """
+    run_start = None
+    for band in bands:
+        if band.state == 'booked':
+            run_start = None
+            continue
+        if run_start is None:
+            run_start = band.start
+        if band.end - run_start >= duration:
+            slot_end = run_start + duration
+            pending = any(b.state == 'pending' and b.start < slot_end and b.end > run_start for b in bands)
+            return run_start, pending
+    return None
+
+
+def find_free_slots(window_start, window_end, duration, min_chairs=0, projector=False,
+                    computer=False, air_conditioner=0, limit=10):
+    """
+    Rooms meeting the requirements, each with its earliest free slot of
+    `duration` between window_start and window_end
+    Candidates come from the room catalog's equipment index; their Pending
+    and Approved bookings in the window are read with ONE query. A slot may
+    overlap Pending requests (they don't block booking) but never an
+    Approved one. Ranked by fit: slots clear of Pending first, then the
+    earliest, then the room with the fewest spare chairs.
+    """
+    from app.cache import room_catalog
+    from app.utils import overlaps
+
+    rooms = room_catalog.matching(min_chairs, projector, computer, air_conditioner)
+    if not rooms or window_end - window_start < duration:
+        return []
+
+    rows = db.session.query(
+        Reserve.room_id, Reserve.start_time, Reserve.end_time, Reserve.status
+    ).filter(
+        Reserve.room_id.in_([room.room_id for room in rooms]),
+        Reserve.status.in_(['Pending', 'Approved']),
+        overlaps(window_start, window_end)
+    ).order_by(Reserve.room_id, Reserve.start_time).all()
+
+    intervals = {}
+    for room_id, start, end, status in rows:
+        intervals.setdefault(room_id, []).append((start, end, status))
+
+    slots = []
+    for room in rooms:
+        bands = build_bands(window_start, window_end, intervals.get(room.room_id, []))
+        found = _earliest_slot(bands, duration)
+        if found:
+            start, pending = found
+            slots.append(Slot(room, start, start + duration, pending))
+
+    slots.sort(key=lambda slot: (slot.pending, slot.start, slot.room.chair - min_chairs, slot.room.room_id))
+    return slots[:limit]
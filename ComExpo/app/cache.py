@@ -0,0 +1,341 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
+from flask import g, has_request_context, render_template
+from flask_login import UserMixin
+from markupsafe import Markup
+from sqlalchemy import event, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, object_session
+from app import db
+from app.models import CacheVersion, Room, User
+
+# --- Shared version counters ---
+# Each cached thing has a row in cache_versions. Writers bump it in the same
+# transaction as the change; readers compare it with the version their
+# in-process copy was built from (one primary-key lookup).
+
+def _bump_statement(dialect_name, *names):
+    insert = postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+    stmt = insert(CacheVersion).values([{'name': name, 'version': 1} for name in names])
+    return stmt.on_conflict_do_update(
+        index_elements=['name'],
+        set_={'version': CacheVersion.version + 1}
+    )
+
+
+def _forget_version(name):
+    if has_request_context():
+        g.setdefault('cache_versions', {}).pop(name, None)
+
+
+def bump_version(name):
+    """Increment a version counter inside the current transaction"""
+    dialect_name = db.session.get_bind().dialect.name
+    db.session.execute(_bump_statement(dialect_name, name))
+    _forget_version(name)
+
+
+def bump_versions(names):
+    """
+    Increment several version counters with ONE statement
+    Names are sorted so concurrent writers lock the rows in the same order.
+    """
+    names = sorted(set(names))
+    if not names:
+        return
+    dialect_name = db.session.get_bind().dialect.name
+    db.session.execute(_bump_statement(dialect_name, *names))
+    for name in names:
+        _forget_version(name)
+
+
+def get_version(name):
+    """
+    Read a version counter (0 if it was never bumped)
+    Cached on flask.g so a request reads each counter at most once.
+    """
+    cached = g.setdefault('cache_versions', {}) if has_request_context() else {}
+    if name not in cached:
+        version = db.session.execute(
+            select(CacheVersion.version).where(CacheVersion.name == name)
+        ).scalar()
+        cached[name] = version or 0
+    return cached[name]
+
+
+# --- Room catalog ---
+
+RoomInfo = namedtuple('RoomInfo', ['room_id', 'chair', 'projector', 'air_conditioner', 'computer'])
+
+
+class RoomCatalog:
+    """
+    Per-process copy of the rooms table
+    Reloaded only when the 'rooms' version changes, so every worker picks
+    up edits on its next request. Lookups by room_id are O(1); equipment
+    searches use an index built with each reload (see matching).
+    """
+
+    def __init__(self):
+        # (version, rooms, rooms_by_id, equipment_index), swapped in one assignment
+        self._state = (None, [], {}, {})
+
+    def _current(self):
+        version = get_version('rooms')
+        state = self._state
+        if version != state[0]:
+            rooms = [
+                RoomInfo(r.room_id, r.chair, r.projector, r.air_conditioner, r.computer)
+                for r in db.session.query(Room).order_by(Room.room_id)
+            ]
+            state = (version, rooms, {room.room_id: room for room in rooms}, _equipment_index(rooms))
+            self._state = state
+        return state
+
+    def all(self):
+        """All rooms, ordered by room_id"""
+        return self._current()[1]
+
+    def get(self, room_id):
+        """One room by id, or None"""
+        return self._current()[2].get(room_id)
+
+    def ids(self):
+        return [room.room_id for room in self.all()]
+
+    def matching(self, min_chairs=0, projector=False, computer=False, air_conditioner=0):
+        """
+        Rooms with at least min_chairs chairs and air_conditioner AC units,
+        and a projector / computers where required; fewest chairs first
+        """
+        results = []
+        for (has_projector, has_computer), (chairs, rooms) in self._current()[3].items():
+            if (projector and not has_projector) or (computer and not has_computer):
+                continue
+            for room in rooms[bisect_left(chairs, min_chairs):]:
+                if room.air_conditioner >= air_conditioner:
+                    results.append(room)
+        results.sort(key=lambda room: (room.chair, room.room_id))
+        return results
+
+
+def _equipment_index(rooms):
+    # (projector, computer) -> (chair counts, rooms), both sorted by chairs
+    groups = {}
+    for room in sorted(rooms, key=lambda room: (room.chair, room.room_id)):
+        groups.setdefault((room.projector, room.computer), []).append(room)
+    return {key: ([room.chair for room in group], group) for key, group in groups.items()}
+
+
+room_catalog = RoomCatalog()
+
+
+# Any ORM write to a Room bumps the catalog version in the same flush
+@event.listens_for(Room, 'after_insert')
+@event.listens_for(Room, 'after_update')
+@event.listens_for(Room, 'after_delete')
+def _room_changed(mapper, connection, target):
+    connection.execute(_bump_statement(connection.dialect.name, 'rooms'))
+    _forget_version('rooms')
+
+
+# --- Flask-Login user cache ---
+
+class UserRecord(UserMixin):
+    """
+    Lightweight stand-in for User on current_user
+    Holds what pages need (no password hash, no relationships).
+    """
+
+    __slots__ = ('username', 'name', 'role', 'std_id')
+
+    def __init__(self, username, name, role, std_id):
+        self.username = username
+        self.name = name
+        self.role = role
+        self.std_id = std_id
+
+    def get_id(self):
+        return self.username
+
+    @property
+    def is_professor(self):
+        return self.role == 'Professor'
+
+    @property
+    def is_student(self):
+        return self.role == 'Student'
+
+
+class UserCache:
+    """
+    Bounded LRU of UserRecords keyed by username, entries expire after ttl
+    Rows changed through the ORM are dropped when their transaction commits.
+    """
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # username -> (loaded_at, UserRecord)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, username):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry and now - entry[0] < self.ttl:
+                self._entries.move_to_end(username)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        row = db.session.execute(
+            select(User.username, User.name, User.role, User.std_id)
+            .where(User.username == username)
+        ).first()
+        if row is None:
+            return None
+
+        record = UserRecord(*row)
+        with self._lock:
+            self._entries[username] = (now, record)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return record
+
+    def invalidate(self, username=None):
+        with self._lock:
+            if username is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(username, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('users_dirty', set()).add(target.username)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_users_after_commit(session):
+    for username in session.info.pop('users_dirty', ()):
+        user_cache.invalidate(username)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_users_after_rollback(session):
+    session.info.pop('users_dirty', None)
+
+
+# --- Rendered row fragments ---
+
+class FragmentCache:
+    """
+    LRU of rendered text (HTML fragments, calendar feeds), capped at max_bytes
+    Keys include a version of what was rendered (a row's row_version, a
+    feed's change counter), so a change simply misses and the stale entry
+    ages out; nothing has to be invalidated.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> Markup
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+    def put(self, key, fragment):
+        size = len(fragment)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = fragment
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+fragment_cache = FragmentCache()
+# Serialized iCalendar feeds, keyed by their user:/room: version (routes/calendar.py)
+feed_cache = FragmentCache(max_bytes=16 * 1024 * 1024)
+
+
+def cached_row(template_name, booking, **context):
+    """
+    Template global: render template_name for one reservation, or reuse it
+    Keyed by reserve_id + row_version, the 'users' version (names shown in
+    rows) and the extra context, which must be all the row depends on.
+    """
+    key = (template_name, booking.reserve_id, booking.row_version, get_version('users'),
+           tuple(sorted(context.items())))
+    fragment = fragment_cache.get(key)
+    if fragment is None:
+        fragment = Markup(render_template(template_name, booking=booking, **context))
+        fragment_cache.put(key, fragment)
+    return fragment
+
+
+# A renamed user changes rows they made or approved
+@event.listens_for(User, 'after_update')
+def _user_renamed(mapper, connection, target):
+    if inspect(target).attrs.name.history.has_changes():
+        connection.execute(_bump_statement(connection.dialect.name, 'users'))
+        _forget_version('users')
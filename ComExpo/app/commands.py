@@ -0,0 +1,178 @@
+import click
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import Room, upgrade_schema
+from app.assets import IMAGE_WIDTHS, build_assets
+from app.export import EXPORT_FORMATS, export_reservations
+from app.importer import import_rooms, import_users
+from app.metrics import flush
+from app.notifications import send_notifications
+from app.sweeper import run_sweep
+from app.utils import (QUEUE_STATUSES, archive_reservations, rebuild_room_day_stats,
+                       get_room_statistics_range)
+
+
+def register_commands(app):
+    """Register the `flask ...` maintenance commands"""
+
+    @app.cli.command('upgrade-db')
+    def upgrade_db():
+        """Create missing tables, columns and indexes on an existing database."""
+        created, overlaps = upgrade_schema()
+        for name in created:
+            click.echo(f'Created table {name}')
+        if 'room_day_stats' in created:
+            click.echo(f'Filled room_day_stats with {rebuild_room_day_stats()} room/day rows')
+        if db.engine.dialect.name != 'postgresql':
+            click.echo('Columns and indexes are only added on Postgres: recreate this database if it predates them.')
+        if overlaps:
+            click.echo('These Approved bookings overlap, so the no-double-booking constraint was NOT added:', err=True)
+            for room_id, reserve_id, start_time, other_id, other_start in overlaps:
+                click.echo(f'  {room_id}: #{reserve_id} ({start_time:%Y-%m-%d %H:%M}) and '
+                           f'#{other_id} ({other_start:%Y-%m-%d %H:%M})', err=True)
+            raise click.ClickException('Decline one booking of each pair, then run upgrade-db again.')
+        click.echo('Schema is up to date')
+
+    @app.cli.command('sweep-expired')
+    def sweep_expired():
+        """Expire Pending/Approved reservations whose end time has passed."""
+        count, elapsed_ms = run_sweep()
+        click.echo(f'Expired {count} reservations in {elapsed_ms:.1f} ms')
+
+    @app.cli.command('rebuild-room-stats')
+    def rebuild_room_stats():
+        """Rebuild the room_day_stats rollup from reserves."""
+        count = rebuild_room_day_stats()
+        click.echo(f'Wrote {count} room/day rows')
+
+    @app.cli.command('archive-reservations')
+    @click.option('--days', type=int, default=None, help='Archive rows that ended more than DAYS ago (default ARCHIVE_AFTER_DAYS).')
+    @click.option('--batch-size', type=int, default=None, help='Rows per transaction (default ARCHIVE_BATCH_SIZE).')
+    @click.option('--max-batches', type=int, default=None, help='Stop after this many batches; rerun to continue.')
+    def archive_reservations_command(days, batch_size, max_batches):
+        """Move old Expired/Declined reservations to reserves_archive."""
+        days = current_app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+        batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+        cutoff = datetime.now() - timedelta(days=days)
+
+        total = archive_reservations(cutoff, batch_size, max_batches,
+                                     progress=lambda moved: click.echo(f'  moved {moved} ...'))
+        click.echo(f'Archived {total} reservations that ended before {cutoff:%Y-%m-%d %H:%M}')
+
+    @app.cli.command('export-reservations')
+    @click.option('--format', 'fmt', type=click.Choice(EXPORT_FORMATS), default='csv')
+    @click.option('--start', help='First book_date (YYYY-MM-DD).')
+    @click.option('--end', help='Last book_date (YYYY-MM-DD).')
+    @click.option('--room', help='Only this room_id.')
+    @click.option('--status', type=click.Choice(QUEUE_STATUSES), help='Only this status.')
+    @click.option('--user', help='Only reservations made by this username.')
+    @click.option('--archived', is_flag=True, help='Include reserves_archive.')
+    @click.option('--output', type=click.File('w'), default='-', help='File to write (default stdout).')
+    def export_reservations_command(fmt, start, end, room, status, user, archived, output):
+        """Stream reservations as CSV or NDJSON."""
+        filters = {
+            'start_date': datetime.strptime(start, '%Y-%m-%d').date() if start else None,
+            'end_date': datetime.strptime(end, '%Y-%m-%d').date() if end else None,
+            'room_id': room,
+            'status': status,
+            'username': user
+        }
+        for chunk in export_reservations(fmt, filters, include_archive=archived):
+            output.write(chunk)
+
+    @app.cli.command('import-rooms')
+    @click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+    @click.option('--batch-size', type=int, default=500, help='Rows per transaction.')
+    def import_rooms_command(csv_file, batch_size):
+        """Create or update rooms from CSV (room_id,chair,projector,air_conditioner,computer)."""
+        _report(*_run_import(import_rooms, csv_file, batch_size=batch_size), 'rooms')
+
+    @app.cli.command('import-users')
+    @click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+    @click.option('--batch-size', type=int, default=500, help='Rows per transaction.')
+    @click.option('--workers', type=int, default=None, help='Password hashing processes (default one per CPU).')
+    def import_users_command(csv_file, batch_size, workers):
+        """Create or update users from CSV (username,name,role,password,std_id)."""
+        _report(*_run_import(import_users, csv_file, batch_size=batch_size, workers=workers), 'users')
+
+    @app.cli.command('send-notifications')
+    @click.option('--loop', 'interval', type=int, default=None,
+                  help='Keep running, draining the outbox every INTERVAL seconds.')
+    @click.option('--max-batches', type=int, default=None, help='Stop after this many batches.')
+    def send_notifications_command(interval, max_batches):
+        """Email queued approval decisions, one digest per user."""
+        while True:
+            try:
+                rows, emails, failures = send_notifications(max_batches=max_batches)
+            except Exception as e:
+                if interval is None:
+                    raise
+                click.echo(f'Notification batch failed, retrying: {e}', err=True)
+                time.sleep(interval)
+                continue
+            if rows or failures or interval is None:
+                click.echo(f'Sent {rows} decisions in {emails} emails, {failures} emails failed')
+            # This process's counters for /metrics (when it shares METRICS_DIR and pids with the web workers)
+            flush(current_app)
+            if interval is None:
+                break
+            time.sleep(interval)
+
+    @app.cli.command('build-assets')
+    @click.option('--quality', type=int, default=70, help='WebP/AVIF/JPEG quality (1-100).')
+    @click.option('--width', 'widths', type=int, multiple=True, help='Image width to generate (repeatable, default 160/320/640/1280).')
+    def build_assets_command(quality, widths):
+        """Fingerprint static files, resize images and pre-compress CSS/JS into static/build."""
+        def progress(path, entry):
+            variants = sum(len(sizes) for sizes in entry.get('variants', {}).values())
+            extra = f' + {variants} variants' if variants else ''
+            if entry.get('encodings'):
+                extra = f" + {', '.join(entry['encodings'])}"
+            click.echo(f"  {path} -> {entry['file']}{extra}")
+
+        try:
+            built = build_assets(current_app.static_folder, widths or IMAGE_WIDTHS, quality, progress=progress)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        click.echo(f'Built {len(built)} assets; restart the workers to pick up the new manifest')
+
+    @app.cli.command('room-utilization')
+    @click.argument('start')
+    @click.argument('end')
+    def room_utilization(start, end):
+        """Print per-room utilization between START and END (YYYY-MM-DD) as CSV."""
+        start_date = datetime.strptime(start, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end, '%Y-%m-%d').date()
+        days = (end_date - start_date).days + 1
+
+        stats = get_room_statistics_range(None, start_date, end_date)
+        totals = {}
+        for (room_id, day), row in stats.items():
+            total = totals.setdefault(room_id, {'requests': 0, 'approved': 0, 'declined': 0, 'minutes': 0})
+            total['requests'] += (row['pending_count'] + row['approved_count']
+                                  + row['declined_count'] + row['expired_count'])
+            total['approved'] += row['approved_count']
+            total['declined'] += row['declined_count']
+            total['minutes'] += row['booked_minutes']
+
+        click.echo('room_id,requests,approved,declined,booked_hours,occupancy_pct')
+        for room in Room.query.order_by(Room.room_id):
+            total = totals.get(room.room_id, {'requests': 0, 'approved': 0, 'declined': 0, 'minutes': 0})
+            occupancy = 100.0 * total['minutes'] / (days * 24 * 60)
+            click.echo(f"{room.room_id},{total['requests']},{total['approved']},{total['declined']},"
+                       f"{total['minutes'] / 60:.1f},{occupancy:.2f}")
+
+
+def _run_import(importer, csv_file, **options):
+    try:
+        return importer(csv_file, progress=lambda total: click.echo(f'  wrote {total} ...'), **options)
+    except ValueError as e:
+        raise click.ClickException(f'{csv_file.name}: {e}')
+
+
+def _report(total, errors, what):
+    for line, message in errors:
+        click.echo(f'  line {line}: {message}', err=True)
+    click.echo(f'Imported {total} {what}, skipped {len(errors)} invalid rows')
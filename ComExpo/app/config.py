@@ -1,14 +1,95 @@
 import os
+from datetime import timedelta
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Connection pool (ignored for SQLite) and connection-wide statement timeout (Postgres, 0 = none)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '30000'))
+
+    # Optional read replica for read_only views; a browser session that just
+    # wrote stays on the primary for REPLICA_LAG_WINDOW seconds
+    DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+    REPLICA_LAG_WINDOW = int(os.getenv('REPLICA_LAG_WINDOW', '5'))
     
     # Session configuration
     PERMANENT_SESSION_LIFETIME = 3600  # 1 hour
-    SESSION_COOKIE_SECURE = True
+    SESSION_COOKIE_SECURE = os.getenv('SESSION_COOKIE_SECURE', 'false').lower() == 'true'  # true behind HTTPS
     SESSION_COOKIE_HTTPONLY = True
+    REMEMBER_COOKIE_DURATION = timedelta(days=30)
     
     # Pagination
-    BOOKINGS_PER_PAGE = 20
\ No newline at end of file
+    BOOKINGS_PER_PAGE = 20
+
+    # Background expiry sweeper (seconds between sweeps, 0 = disabled). Pages
+    # no longer expire rows as they are read, so leave it on unless
+    # `flask sweep-expired` runs from cron; the leader lock keeps it to one worker
+    EXPIRY_SWEEP_INTERVAL = int(os.getenv('EXPIRY_SWEEP_INTERVAL', '60'))
+
+    # Availability grid cache (seconds, bounds staleness across workers)
+    AVAILABILITY_CACHE_TTL = int(os.getenv('AVAILABILITY_CACHE_TTL', '60'))
+
+    # Flask-Login user cache
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '1024'))
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '60'))
+
+    # Open /api/events streams per worker; each holds one gunicorn thread,
+    # so keep it below --threads (more are refused with 503)
+    SSE_MAX_STREAMS = int(os.getenv('SSE_MAX_STREAMS', '16'))
+
+    # Rendered history/approval rows (per worker, bytes of HTML)
+    FRAGMENT_CACHE_MAX_BYTES = int(os.getenv('FRAGMENT_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+
+    # iCalendar feeds: days of past events kept, seconds a sync token is
+    # backdated (> longest transaction + replica lag), zone of the stored
+    # wall-clock times, serialized feed cache per worker (bytes)
+    CALENDAR_PAST_DAYS = int(os.getenv('CALENDAR_PAST_DAYS', '90'))
+    CALENDAR_SYNC_OVERLAP = int(os.getenv('CALENDAR_SYNC_OVERLAP', '120'))
+    CALENDAR_TIMEZONE = os.getenv('CALENDAR_TIMEZONE', 'Asia/Bangkok')
+    CALENDAR_CACHE_MAX_BYTES = int(os.getenv('CALENDAR_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+
+    # /metrics (per-worker snapshot dir, seconds between snapshots, slow query log threshold)
+    METRICS_DIR = os.getenv('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '250'))
+
+    # Password hashing: werkzeug method (changing it rehashes each user at
+    # their next login), hashing threads and queue limit per worker
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '32'))
+
+    # Failed logins allowed per username / per IP within LOGIN_THROTTLE_WINDOW seconds (per worker)
+    LOGIN_MAX_FAILURES_PER_USER = int(os.getenv('LOGIN_MAX_FAILURES_PER_USER', '5'))
+    LOGIN_MAX_FAILURES_PER_IP = int(os.getenv('LOGIN_MAX_FAILURES_PER_IP', '20'))
+    LOGIN_THROTTLE_WINDOW = int(os.getenv('LOGIN_THROTTLE_WINDOW', '300'))
+
+    # Decision emails: the outbox is drained every NOTIFICATION_INTERVAL seconds
+    # by the leader worker (0 = only by `flask send-notifications`); failed
+    # sends are retried after RETRY_BASE * 2^(attempt-1) seconds, capped at RETRY_MAX.
+    # A claimed batch is leased for NOTIFICATION_LEASE seconds, which must be
+    # longer than sending it takes (up to a few SMTP_TIMEOUTs per recipient)
+    NOTIFICATION_INTERVAL = int(os.getenv('NOTIFICATION_INTERVAL', '0'))
+    NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', '200'))
+    NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', '8'))
+    NOTIFICATION_RETRY_BASE = int(os.getenv('NOTIFICATION_RETRY_BASE', '30'))
+    NOTIFICATION_RETRY_MAX = int(os.getenv('NOTIFICATION_RETRY_MAX', '3600'))
+    NOTIFICATION_LEASE = int(os.getenv('NOTIFICATION_LEASE', '900'))
+    SMTP_HOST = os.getenv('SMTP_HOST', 'localhost')
+    SMTP_PORT = int(os.getenv('SMTP_PORT', '25'))
+    SMTP_USERNAME = os.getenv('SMTP_USERNAME')
+    SMTP_PASSWORD = os.getenv('SMTP_PASSWORD')
+    SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'false').lower() == 'true'
+    SMTP_TIMEOUT = int(os.getenv('SMTP_TIMEOUT', '10'))
+    MAIL_FROM = os.getenv('MAIL_FROM', 'RoomRak <no-reply@roomrak.local>')
+
+    # Archive: terminal reservations that ended more than ARCHIVE_AFTER_DAYS ago
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '180'))
+    ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '1000'))
\ No newline at end of file
@@ -0,0 +1,71 @@
+import time
+from functools import wraps
+from flask import current_app, has_request_context, request, session as flask_session
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+# The SQLALCHEMY_BINDS key of the optional read replica
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(FlaskSQLAlchemySession):
+    """
+    Session that can send reads to the read replica
+    Only when the view asked for it (read_only) and never for flushes or
+    INSERT/UPDATE/DELETE statements, which always go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and self.info.get('use_replica') and not self._flushing
+                and not getattr(clause, 'is_dml', False)):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _recently_wrote():
+    return flask_session.get('primary_until', 0) > time.time()
+
+
+def read_only(f):
+    """
+    Decorator for views that only read: their queries go to the replica
+    Falls back to the primary when no replica is configured, or for
+    REPLICA_LAG_WINDOW seconds after this browser session wrote something
+    (read-your-own-writes).
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        from app import db
+        if REPLICA_BIND in current_app.config.get('SQLALCHEMY_BINDS', {}) and not _recently_wrote():
+            db.session.info['use_replica'] = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def statement_timeout(ms):
+    """
+    Decorator: cap every statement of the view's transaction at ms (Postgres)
+    Uses SET LOCAL, so it ends with the transaction; the connection-wide
+    default is DB_STATEMENT_TIMEOUT_MS. Put it below read_only.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            from app import db
+            if db.session.get_bind().dialect.name == 'postgresql':
+                db.session.execute(text(f'SET LOCAL statement_timeout = {int(ms)}'))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+@event.listens_for(Session, 'after_commit')
+def _remember_write(session):
+    # Pin this browser session to the primary for a while after it writes
+    if has_request_context() and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        window = current_app.config.get('REPLICA_LAG_WINDOW', 0)
+        if window:
+            flask_session['primary_until'] = time.time() + window
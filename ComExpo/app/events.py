@@ -0,0 +1,203 @@
+import json
+import queue
+import select
+import threading
+import time
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from app import db
+
+# Postgres NOTIFY channel; payloads are JSON lists of events
+NOTIFY_CHANNEL = 'reservation_events'
+# pg_notify payloads must be shorter than 8000 bytes; events are packed
+# into as few payloads as fit under this
+NOTIFY_MAX_BYTES = 7900
+# Events buffered per SSE connection before it is told to resync
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class TooManyStreams(Exception):
+    """This worker already serves max_streams SSE connections"""
+
+
+class Broker:
+    """
+    In-process fan-out of reservation events to SSE subscribers
+    Each subscriber is a bounded queue registered on one or more channels
+    ('user:<username>', 'pending'). A subscriber that falls behind gets a
+    single 'resync' event instead of blocking publishers. Every open stream
+    holds a worker thread, so at most max_streams are subscribed at once.
+    """
+
+    def __init__(self, max_streams=16):
+        self._lock = threading.Lock()
+        self._channels = {}  # channel -> set of queues
+        self._streams = 0
+        self.max_streams = max_streams
+
+    def subscribe(self, channels):
+        """Register a new subscriber queue (raises TooManyStreams at max_streams)"""
+        subscription = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            if self._streams >= self.max_streams:
+                raise TooManyStreams()
+            self._streams += 1
+            for channel in channels:
+                self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription, channels):
+        with self._lock:
+            self._streams -= 1
+            for channel in channels:
+                subscribers = self._channels.get(channel)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def publish(self, events):
+        for item in events:
+            channels = ['pending', f"user:{item['reserve_by']}"]
+            with self._lock:
+                targets = set()
+                for channel in channels:
+                    targets.update(self._channels.get(channel, ()))
+            for subscription in targets:
+                _offer(subscription, item)
+
+    def subscriber_count(self):
+        with self._lock:
+            return self._streams
+
+
+def _offer(subscription, item):
+    try:
+        subscription.put_nowait(item)
+    except queue.Full:
+        # Slow client: drop its backlog, it reloads on 'resync'
+        while True:
+            try:
+                subscription.get_nowait()
+            except queue.Empty:
+                break
+        subscription.put_nowait({'type': 'resync'})
+
+
+broker = Broker()
+
+
+def queue_events(reservations):
+    """
+    Remember status-change events for reservations changed in this session
+    Published after commit: through NOTIFY on Postgres (every worker gets
+    it), directly to this process's broker elsewhere.
+    """
+    pending = db.session.info.setdefault('events_dirty', [])
+    for reservation in reservations:
+        status = getattr(reservation, 'status', None)
+        reserve_by = getattr(reservation, 'reserve_by', None)
+        if status is None or reserve_by is None:
+            continue
+        pending.append({
+            'type': 'reservation',
+            'reserve_id': reservation.reserve_id,
+            'room_id': reservation.room_id,
+            'reserve_by': reserve_by,
+            'status': status,
+            'start_time': reservation.start_time.isoformat(timespec='minutes'),
+            'end_time': reservation.end_time.isoformat(timespec='minutes')
+        })
+
+
+@event.listens_for(Session, 'before_commit')
+def _notify_before_commit(session):
+    # NOTIFY is transactional: delivered to listeners only if the commit succeeds
+    if session.get_bind().dialect.name != 'postgresql':
+        return
+    events = session.info.pop('events_dirty', None)
+    for payload in _payloads(events or ()):
+        session.execute(
+            text('SELECT pg_notify(:channel, :payload)'),
+            {'channel': NOTIFY_CHANNEL, 'payload': payload}
+        )
+
+
+def _payloads(events, max_bytes=NOTIFY_MAX_BYTES):
+    """JSON lists of events, each encoding to at most max_bytes"""
+    batch, size = [], 2  # '[' and ']'
+    for item in events:
+        # json.dumps escapes to ASCII, so characters are bytes
+        encoded = json.dumps(item)
+        if batch and size + 2 + len(encoded) > max_bytes:
+            yield '[' + ', '.join(batch) + ']'
+            batch, size = [], 2
+        batch.append(encoded)
+        size += len(encoded) + (2 if len(batch) > 1 else 0)
+    if batch:
+        yield '[' + ', '.join(batch) + ']'
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_after_commit(session):
+    events = session.info.pop('events_dirty', None)
+    if events:
+        broker.publish(events)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_events_after_rollback(session):
+    session.info.pop('events_dirty', None)
+
+
+# --- Postgres LISTEN thread (one connection per worker process) ---
+
+_listener_started = False
+_listener_lock = threading.Lock()
+
+
+def _listen_loop(app):
+    while True:
+        conn = None
+        try:
+            with app.app_context():
+                # Detached from the pool so it doesn't use up a pooled slot
+                raw = db.engine.raw_connection()
+                raw.detach()
+            conn = raw.driver_connection
+            conn.autocommit = True
+            conn.cursor().execute(f'LISTEN {NOTIFY_CHANNEL}')
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    broker.publish(json.loads(conn.notifies.pop(0).payload))
+        except Exception as e:
+            app.logger.warning('event listener failed, reconnecting: %s', e)
+            time.sleep(5)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def start_listener(app):
+    """
+    Start this worker's LISTEN thread (Postgres only, once per process)
+    On other databases events are published in-process after commit.
+    """
+    global _listener_started
+    if _listener_started:
+        return
+    with _listener_lock:
+        if _listener_started:
+            return
+        _listener_started = True
+        if db.engine.dialect.name != 'postgresql':
+            return
+    thread = threading.Thread(target=_listen_loop, args=(app,),
+                              name='event-listener', daemon=True)
+    thread.start()
@@ -0,0 +1,92 @@
+import csv
+import io
+import json
+from sqlalchemy import String, cast, select, union_all
+from sqlalchemy.orm import aliased
+from app import db
+from app.models import Reserve, ReserveArchive, User
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+EXPORT_COLUMNS = ['reserve_id', 'room_id', 'book_date', 'start_time', 'end_time', 'status',
+                  'reserve_by', 'reserver_name', 'approve_by', 'approver_name', 'approve_date',
+                  'reserve_date', 'reason', 'series_id']
+
+
+def _select(model, filters):
+    # Names come from joins, so no per-row lazy loads
+    reserver = aliased(User)
+    approver = aliased(User)
+    stmt = (
+        select(model.reserve_id, model.room_id, model.book_date, model.start_time, model.end_time,
+               # Enum in reserves, varchar in the archive: Postgres only UNIONs them as text
+               cast(model.status, String).label('status'), model.reserve_by, reserver.name.label('reserver_name'),
+               model.approve_by, approver.name.label('approver_name'), model.approve_date,
+               model.reserve_date, model.reason, model.series_id)
+        .join(reserver, reserver.username == model.reserve_by)
+        .outerjoin(approver, approver.username == model.approve_by)
+    )
+    if filters.get('start_date'):
+        stmt = stmt.where(model.book_date >= filters['start_date'])
+    if filters.get('end_date'):
+        stmt = stmt.where(model.book_date <= filters['end_date'])
+    if filters.get('room_id'):
+        stmt = stmt.where(model.room_id == filters['room_id'])
+    if filters.get('status'):
+        stmt = stmt.where(model.status == filters['status'])
+    if filters.get('username'):
+        stmt = stmt.where(model.reserve_by == filters['username'])
+    return stmt
+
+
+def iter_reservations(filters, include_archive=False, batch_size=1000):
+    """
+    Stream reservations matching filters as row tuples (EXPORT_COLUMNS order)
+    filters: start_date, end_date (book_date range), room_id, status, username.
+    Rows are fetched batch_size at a time (server-side cursor on Postgres),
+    so memory stays flat however many rows match.
+    """
+    stmt = _select(Reserve, filters)
+    if include_archive:
+        stmt = union_all(stmt, _select(ReserveArchive, filters))
+    stmt = stmt.order_by('book_date', 'start_time', 'reserve_id')
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        yield from partition
+
+
+def _value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def to_csv(rows, batch_size=1000):
+    """Yield CSV text: a header line, then about batch_size rows per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow([_value(value) for value in row])
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def to_ndjson(rows, batch_size=1000):
+    """Yield newline-delimited JSON, about batch_size objects per chunk"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({column: _value(value) for column, value in zip(EXPORT_COLUMNS, row)}))
+        if len(lines) == batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def export_reservations(fmt, filters, include_archive=False, batch_size=1000):
+    """Generator of text chunks in the given format ('csv' or 'ndjson')"""
+    rows = iter_reservations(filters, include_archive, batch_size)
+    return to_csv(rows, batch_size) if fmt == 'csv' else to_ndjson(rows, batch_size)
@@ -0,0 +1,189 @@
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from itsdangerous import BadSignature, URLSafeSerializer
+from flask import current_app
+from sqlalchemy import and_, or_, select
+from app import db
+from app.models import Reserve
+
+FEED_KINDS = ('user', 'room')
+PRODID = '-//RoomRak//Classroom Booking//EN'
+SYNC_TOKEN_FORMAT = '%Y%m%dT%H%M%S%f'
+# Calendar apps that honour it poll about this often
+REFRESH_INTERVAL = 'PT15M'
+
+
+# --- Feed URLs ---
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='calendar-feed')
+
+
+def feed_token(username):
+    """
+    Secret for a user's feed URLs (the signed username)
+    Calendar apps can't log in, so the URL itself is the credential.
+    Rotating SECRET_KEY revokes every feed URL.
+    """
+    return _serializer().dumps(username)
+
+
+def feed_username(token):
+    """The username a feed token was issued to, or None if it is not valid"""
+    try:
+        return _serializer().loads(token)
+    except BadSignature:
+        return None
+
+
+def sync_token(now=None):
+    """
+    Watermark for ?since=: rows changed after it are sent again
+    Backdated by CALENDAR_SYNC_OVERLAP seconds, so changes made by
+    transactions that committed (or reached the replica) after this feed
+    was read are not skipped; clients just see a few events twice.
+    """
+    now = now or datetime.utcnow()
+    return (now - timedelta(seconds=current_app.config['CALENDAR_SYNC_OVERLAP'])).strftime(SYNC_TOKEN_FORMAT)
+
+
+def parse_sync_token(token):
+    """changed_at watermark of a sync token (raises ValueError)"""
+    return datetime.strptime(token, SYNC_TOKEN_FORMAT)
+
+
+# --- Rows ---
+
+def _in_feed(kind):
+    # Approved bookings, and approved ones that have since run (the sweeper
+    # expires them but keeps approve_by); a user's feed adds their requests
+    approved = or_(Reserve.status == 'Approved',
+                   and_(Reserve.status == 'Expired', Reserve.approve_by.isnot(None)))
+    if kind == 'user':
+        return or_(Reserve.status == 'Pending', approved)
+    return approved
+
+
+def iter_feed_rows(kind, key, window_start, since=None, batch_size=500):
+    """
+    Stream the reservations of one feed: a user's (kind 'user', key username)
+    or a room's (kind 'room', key room_id)
+    Full feeds hold the events ending after window_start. With since (a
+    changed_at watermark) only rows changed after it are returned, for user
+    feeds including ones that left the feed, so clients can drop them; each
+    row carries an in_feed flag.
+    """
+    in_feed = _in_feed(kind)
+    stmt = select(
+        Reserve.reserve_id, Reserve.room_id, Reserve.start_time, Reserve.end_time, Reserve.status,
+        Reserve.reason, Reserve.row_version, Reserve.changed_at, in_feed.label('in_feed')
+    ).where(Reserve.reserve_by == key if kind == 'user' else Reserve.room_id == key)
+    if since is None:
+        stmt = stmt.where(in_feed, Reserve.end_time >= window_start)
+    else:
+        stmt = stmt.where(Reserve.changed_at > since)
+        if kind == 'room':
+            # Rows join a room feed when approved and approval is final:
+            # Approved only turns into Expired, which keeps approve_by and
+            # stays in the feed. So changed rows outside it (new requests,
+            # declines, which also carry approve_by) were never in it.
+            stmt = stmt.where(in_feed)
+    stmt = stmt.order_by(Reserve.start_time, Reserve.reserve_id)
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        yield from partition
+
+
+# --- Serializer (RFC 5545) ---
+
+def _escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line):
+    # Content lines are at most 75 octets; continuations start with a space.
+    # Cut on character boundaries so multi-byte UTF-8 stays whole.
+    if len(line.encode()) <= 75:
+        return line + '\r\n'
+    parts = []
+    current, size, limit = [], 0, 75
+    for char in line:
+        width = len(char.encode())
+        if size + width > limit:
+            parts.append(''.join(current))
+            current, size, limit = [], 0, 74
+        current.append(char)
+        size += width
+    parts.append(''.join(current))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _utc(value, tz):
+    # Reservation times are local wall-clock times in CALENDAR_TIMEZONE
+    return value.replace(tzinfo=tz).astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _event(row, kind, tz):
+    if not row.in_feed:
+        status = 'CANCELLED'
+    elif row.status == 'Pending':
+        status = 'TENTATIVE'
+    else:
+        status = 'CONFIRMED'
+    if kind == 'user':
+        summary = f'{row.room_id} booking' + (' (pending approval)' if status == 'TENTATIVE' else '')
+    else:
+        summary = f'{row.room_id}: booked'
+    changed = row.changed_at.strftime('%Y%m%dT%H%M%SZ')
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:reservation-{row.reserve_id}@roomrak',
+        f'DTSTAMP:{changed}',
+        f'LAST-MODIFIED:{changed}',
+        # row_version goes up with every UPDATE of the row
+        f'SEQUENCE:{row.row_version}',
+        f'DTSTART:{_utc(row.start_time, tz)}',
+        f'DTEND:{_utc(row.end_time, tz)}',
+        f'SUMMARY:{_escape(summary)}',
+        f'LOCATION:{_escape(row.room_id)}',
+        f'STATUS:{status}',
+    ]
+    # Reasons are only shown to the person who booked
+    if kind == 'user' and row.reason:
+        lines.append(f'DESCRIPTION:{_escape(row.reason)}')
+    lines.append('END:VEVENT')
+    return ''.join(_fold(line) for line in lines)
+
+
+def serialize_feed(rows, kind, name, token, batch_size=200):
+    """
+    Yield a VCALENDAR as text chunks of about batch_size events
+    token is the sync token clients pass back as ?since= (X-SYNC-TOKEN).
+    """
+    tz = ZoneInfo(current_app.config['CALENDAR_TIMEZONE'])
+    header = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_escape(name)}',
+        f'REFRESH-INTERVAL;VALUE=DURATION:{REFRESH_INTERVAL}',
+        f'X-PUBLISHED-TTL:{REFRESH_INTERVAL}',
+        f'X-SYNC-TOKEN:{token}',
+    ]
+    chunk = [''.join(_fold(line) for line in header)]
+    for row in rows:
+        chunk.append(_event(row, kind, tz))
+        if len(chunk) >= batch_size:
+            yield ''.join(chunk)
+            chunk = []
+    chunk.append('END:VCALENDAR\r\n')
+    yield ''.join(chunk)
+
+
+def feed(kind, key, name, window_start, since=None):
+    """Stream one feed as ICS text chunks (see iter_feed_rows and serialize_feed)"""
+    token = sync_token()
+    return serialize_feed(iter_feed_rows(kind, key, window_start, since), kind, name, token)
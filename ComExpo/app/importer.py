@@ -0,0 +1,175 @@
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from flask import current_app
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.security import generate_password_hash
+from app import db
+from app.cache import bump_version, user_cache
+from app.models import Room, User
+
+ROOM_COLUMNS = ['room_id', 'chair', 'projector', 'air_conditioner', 'computer']
+USER_COLUMNS = ['username', 'name', 'role', 'password', 'std_id']
+USER_ROLES = ('Student', 'Professor')
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+FALSE_VALUES = ('0', 'false', 'no', 'n', '')
+
+
+def read_batches(stream, columns, batch_size):
+    """
+    Yield lists of (line number, row dict) from a CSV file, batch_size at a time
+    Only one batch is held in memory. Raises ValueError if a column is missing.
+    """
+    reader = csv.DictReader(stream)
+    missing = [column for column in columns if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"missing column(s): {', '.join(missing)}")
+    rows = ((reader.line_num, row) for row in reader)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _text(row, column):
+    return (row.get(column) or '').strip()
+
+
+def _bool(row, column):
+    value = _text(row, column).lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(f'{column} must be true or false')
+
+
+def _int(row, column):
+    try:
+        value = int(_text(row, column))
+    except ValueError:
+        raise ValueError(f'{column} must be a whole number')
+    if value < 0:
+        raise ValueError(f'{column} cannot be negative')
+    return value
+
+
+def parse_room(row):
+    """Validated rooms-table values for one CSV row (raises ValueError)"""
+    room_id = _text(row, 'room_id')
+    if not room_id:
+        raise ValueError('room_id is required')
+    return {
+        'room_id': room_id,
+        'chair': _int(row, 'chair'),
+        'projector': _bool(row, 'projector'),
+        'air_conditioner': _int(row, 'air_conditioner'),
+        'computer': _bool(row, 'computer')
+    }
+
+
+def parse_user(row):
+    """
+    Validated users-table values for one CSV row (raises ValueError)
+    The plain password is returned under 'password'; it is hashed later.
+    """
+    username = _text(row, 'username').lower()
+    name = _text(row, 'name')
+    role = _text(row, 'role').capitalize()
+    password = row.get('password') or ''
+    std_id = _text(row, 'std_id') or None
+    if '@' not in username:
+        raise ValueError('username must be an email address')
+    if not name:
+        raise ValueError('name is required')
+    if role not in USER_ROLES:
+        raise ValueError(f"role must be one of {', '.join(USER_ROLES)}")
+    if not password:
+        raise ValueError('password is required')
+    if std_id and len(std_id) > 11:
+        raise ValueError('std_id is longer than 11 characters')
+    return {'username': username, 'name': name, 'role': role, 'password': password, 'std_id': std_id}
+
+
+def _validate(batch, parse, key, errors):
+    # One row per key: Postgres refuses to update the same row twice in one
+    # INSERT ... ON CONFLICT, so the last occurrence in the batch wins
+    values = {}
+    for line, row in batch:
+        try:
+            parsed = parse(row)
+        except ValueError as e:
+            errors.append((line, str(e)))
+            continue
+        values[parsed[key]] = parsed
+    return list(values.values())
+
+
+def _upsert(model, rows, key, update_columns):
+    """INSERT ... ON CONFLICT (key) DO UPDATE for a list of value dicts"""
+    insert = postgresql.insert if db.session.get_bind().dialect.name == 'postgresql' else sqlite.insert
+    stmt = insert(model).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[key],
+        set_={column: stmt.excluded[column] for column in update_columns}
+    )
+    db.session.execute(stmt)
+
+
+def import_rooms(stream, batch_size=500, progress=None):
+    """
+    Upsert rooms from CSV (room_id, chair, projector, air_conditioner, computer)
+    One transaction per batch. Returns (rows written, [(line, error), ...]).
+    """
+    errors = []
+    total = 0
+    for batch in read_batches(stream, ROOM_COLUMNS, batch_size):
+        rows = _validate(batch, parse_room, 'room_id', errors)
+        if not rows:
+            continue
+        _upsert(Room, rows, 'room_id', ROOM_COLUMNS[1:])
+        # Core statements skip the ORM events, so bump the catalog here
+        bump_version('rooms')
+        db.session.commit()
+        total += len(rows)
+        if progress:
+            progress(total)
+    return total, errors
+
+
+def import_users(stream, batch_size=500, workers=None, progress=None):
+    """
+    Upsert users from CSV (username, name, role, password, std_id)
+    Passwords are hashed in a process pool (workers processes, default one
+    per CPU), one batch at a time. Existing users get the new name, role,
+    std_id and password; register_date is kept. One transaction per batch.
+    Returns (rows written, [(line, error), ...]).
+    """
+    errors = []
+    total = 0
+    workers = workers or os.cpu_count() or 1
+    hash_password = partial(generate_password_hash, method=current_app.config['PASSWORD_HASH_METHOD'])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch in read_batches(stream, USER_COLUMNS, batch_size):
+            rows = _validate(batch, parse_user, 'username', errors)
+            if not rows:
+                continue
+            chunksize = max(1, len(rows) // (4 * workers))
+            hashes = pool.map(hash_password, [row.pop('password') for row in rows],
+                              chunksize=chunksize)
+            for row, password_hash in zip(rows, hashes):
+                row['hash_password'] = password_hash
+            _upsert(User, rows, 'username', ['name', 'role', 'std_id', 'hash_password'])
+            # Names appear in cached history/approval rows
+            bump_version('users')
+            db.session.commit()
+            # Only this process's cache; web workers pick changes up within USER_CACHE_TTL
+            for row in rows:
+                user_cache.invalidate(row['username'])
+            total += len(rows)
+            if progress:
+                progress(total)
+    return total, errors
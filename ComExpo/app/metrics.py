@@ -0,0 +1,378 @@
+import atexit
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from flask import Response, g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from app import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+# Counters and histograms of exited processes, summed (see _archive)
+ARCHIVE_FILE = 'archived.json'
+ARCHIVE_LOCK = 'archive.lock'
+
+# name -> (type, help) for the exposition; order is the output order
+METRICS = {
+    'http_requests_total': ('counter', 'Requests handled, by endpoint, method and status'),
+    'http_request_duration_seconds': ('histogram', 'Request latency by endpoint'),
+    'http_request_sql_queries': ('histogram', 'SQL statements per request by endpoint'),
+    'http_request_sql_seconds_total': ('counter', 'Time spent in SQL by endpoint'),
+    'template_render_seconds': ('histogram', 'Template render time by template'),
+    'sql_slow_queries_total': ('counter', 'Statements slower than SLOW_QUERY_MS'),
+    'user_cache_hits_total': ('counter', 'Flask-Login user cache hits'),
+    'user_cache_misses_total': ('counter', 'Flask-Login user cache misses'),
+    'user_cache_evictions_total': ('counter', 'Flask-Login user cache evictions'),
+    'user_cache_entries': ('gauge', 'Users currently cached'),
+    'fragment_cache_hits_total': ('counter', 'Rendered row fragments served from cache'),
+    'fragment_cache_misses_total': ('counter', 'Rendered row fragments rendered afresh'),
+    'fragment_cache_evictions_total': ('counter', 'Row fragments evicted by the size cap'),
+    'fragment_cache_bytes': ('gauge', 'Bytes of cached row fragments'),
+    'calendar_feed_cache_hits_total': ('counter', 'Full iCalendar feeds served from cache'),
+    'calendar_feed_cache_misses_total': ('counter', 'Full iCalendar feeds serialized afresh'),
+    'calendar_feed_cache_bytes': ('gauge', 'Bytes of cached iCalendar feeds'),
+    'sse_subscribers': ('gauge', 'Open Server-Sent Events streams'),
+    'sse_streams_refused_total': ('counter', 'Event streams refused with 503 because SSE_MAX_STREAMS were open'),
+    'login_throttled_total': ('counter', 'Login attempts rejected by the failed-login throttle'),
+    'password_hasher_busy_total': ('counter', 'Logins/registrations refused because the hash queue was full or too slow'),
+    'notifications_sent_total': ('counter', 'Decision notifications (outbox rows) emailed'),
+    'notification_emails_total': ('counter', 'Digest emails by result (sent, failed)'),
+    'notification_batch_seconds': ('histogram', 'Time to claim, send and commit one outbox batch'),
+    'notification_outbox_backlog': ('gauge', 'Outbox rows waiting to be sent, as of the last drain'),
+}
+
+
+class Registry:
+    """
+    This worker's counters, gauges and histograms
+    Keys are (name, labels) with labels a sorted tuple of (key, value).
+    Histograms hold cumulative bucket counts followed by sum and count.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, tuple(sorted(labels)))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, labels=(), kind='gauge'):
+        # Absolute values read from elsewhere (cache stats); kind picks the table
+        table = self.gauges if kind == 'gauge' else self.counters
+        with self._lock:
+            table[(name, tuple(sorted(labels)))] = value
+
+    def observe(self, name, value, buckets, labels=()):
+        key = (name, tuple(sorted(labels)))
+        with self._lock:
+            entry = self.histograms.get(key)
+            if entry is None:
+                entry = self.histograms[key] = {'buckets': list(buckets), 'counts': [0] * len(buckets),
+                                                'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    entry['counts'][i] += 1
+            entry['sum'] += value
+            entry['count'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'gauges': [[name, labels, value] for (name, labels), value in self.gauges.items()],
+                'histograms': [[name, labels, dict(entry, counts=list(entry['counts']))]
+                               for (name, labels), entry in self.histograms.items()]
+            }
+
+
+registry = Registry()
+
+
+# --- Per-worker files, merged on scrape ---
+
+def _metrics_dir(app):
+    return app.config.get('METRICS_DIR') or os.path.join(app.instance_path, 'metrics')
+
+
+def flush(app):
+    """Write this worker's snapshot to <METRICS_DIR>/<pid>.json (atomic replace)"""
+    from app.cache import feed_cache, fragment_cache, user_cache
+    from app.events import broker
+    from app.passwords import login_throttle, password_hasher
+
+    stats = user_cache.stats()
+    registry.set('user_cache_hits_total', stats['hits'], kind='counter')
+    registry.set('user_cache_misses_total', stats['misses'], kind='counter')
+    registry.set('user_cache_evictions_total', stats['evictions'], kind='counter')
+    registry.set('user_cache_entries', stats['size'])
+    stats = fragment_cache.stats()
+    registry.set('fragment_cache_hits_total', stats['hits'], kind='counter')
+    registry.set('fragment_cache_misses_total', stats['misses'], kind='counter')
+    registry.set('fragment_cache_evictions_total', stats['evictions'], kind='counter')
+    registry.set('fragment_cache_bytes', stats['bytes'])
+    stats = feed_cache.stats()
+    registry.set('calendar_feed_cache_hits_total', stats['hits'], kind='counter')
+    registry.set('calendar_feed_cache_misses_total', stats['misses'], kind='counter')
+    registry.set('calendar_feed_cache_bytes', stats['bytes'])
+    registry.set('sse_subscribers', broker.subscriber_count())
+    registry.set('login_throttled_total', login_throttle.rejected, kind='counter')
+    registry.set('password_hasher_busy_total', password_hasher.busy, kind='counter')
+
+    directory = _metrics_dir(app)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(path + '.tmp', path)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(totals, snapshot):
+    counters, gauges, histograms = totals
+    for name, labels, value in snapshot['counters']:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, value in snapshot.get('gauges', ()):
+        key = (name, tuple(map(tuple, labels)))
+        gauges[key] = gauges.get(key, 0) + value
+    for name, labels, entry in snapshot['histograms']:
+        key = (name, tuple(map(tuple, labels)))
+        merged = histograms.get(key)
+        if merged is None:
+            histograms[key] = dict(entry, counts=list(entry['counts']))
+        else:
+            merged['counts'] = [a + b for a, b in zip(merged['counts'], entry['counts'])]
+            merged['sum'] += entry['sum']
+            merged['count'] += entry['count']
+
+
+def _archive(directory, paths):
+    """
+    Fold exited workers' counters and histograms into archived.json and
+    delete their snapshots, so the summed totals never go backwards (which
+    Prometheus would read as a counter reset). Their gauges are dropped.
+    Serialized across workers with a lock file; a snapshot another worker
+    archived first is skipped.
+    """
+    with open(os.path.join(directory, ARCHIVE_LOCK), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(directory, ARCHIVE_FILE)
+        totals = ({}, {}, {})
+        archived = _load(archive_path)
+        if archived:
+            _merge(totals, archived)
+        merged = []
+        for path in paths:
+            snapshot = _load(path)
+            if snapshot is not None:
+                _merge(totals, dict(snapshot, gauges=()))
+                merged.append(path)
+        if not merged:
+            return
+        counters, _, histograms = totals
+        with open(archive_path + '.tmp', 'w') as f:
+            json.dump({
+                'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+                'histograms': [[name, labels, entry] for (name, labels), entry in histograms.items()]
+            }, f)
+        os.replace(archive_path + '.tmp', archive_path)
+        for path in merged:
+            os.remove(path)
+
+
+def collect(app):
+    """
+    Merge every worker's snapshot: counters and histograms are summed
+    Snapshots of workers that have exited are first folded into the
+    archive (see _archive), which is added like one more worker.
+    """
+    directory = _metrics_dir(app)
+    live, dead = [], []
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            pid = int(os.path.basename(path).split('.')[0])
+        except ValueError:
+            continue  # archived.json
+        (live if pid == os.getpid() or _pid_alive(pid) else dead).append(path)
+    if dead:
+        _archive(directory, dead)
+
+    totals = ({}, {}, {})
+    for path in live + [os.path.join(directory, ARCHIVE_FILE)]:
+        snapshot = _load(path)
+        if snapshot is not None:
+            _merge(totals, snapshot)
+    return totals
+
+
+_retired = {}  # pid -> True once retire() ran (forked children start afresh)
+
+
+def retire(app):
+    """
+    Final flush of this process, archived right away (runs at exit)
+    Keeps the counts since the last flush of a worker that is recycled
+    (max_requests, HUP, shutdown) or of a CLI command that recorded any.
+    """
+    path = os.path.join(_metrics_dir(app), f'{os.getpid()}.json')
+    if _retired.get(os.getpid()) or not (registry.counters or registry.histograms or os.path.exists(path)):
+        return
+    # The registry isn't reset: archiving it twice would count it twice
+    _retired[os.getpid()] = True
+    try:
+        flush(app)
+        _archive(_metrics_dir(app), [path])
+    except OSError as e:
+        app.logger.warning('could not write metrics at exit: %s', e)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(counters, gauges, histograms):
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        table = {'counter': counters, 'gauge': gauges, 'histogram': histograms}[kind]
+        series = sorted(((labels, value) for (metric, labels), value in table.items() if metric == name),
+                        key=lambda item: item[0])
+        if not series:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in series:
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            for bound, count in zip(value['buckets'], value['counts']):
+                lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {count}')
+            lines.append(f'{name}_bucket{_labels(labels, [("le", "+Inf")])} {value["count"]}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(value["sum"])}')
+            lines.append(f'{name}_count{_labels(labels)} {value["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+# --- Hooks ---
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def _instrument_engine(app, engine):
+    slow_seconds = app.config['SLOW_QUERY_MS'] / 1000.0
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        in_request = has_request_context()
+        if in_request and 'sql_count' in g:
+            g.sql_count += 1
+            g.sql_seconds += elapsed
+        if elapsed >= slow_seconds:
+            endpoint = _endpoint() if in_request else 'background'
+            registry.inc('sql_slow_queries_total', [('endpoint', endpoint)])
+            app.logger.warning('slow query (%.1f ms) in %s: %s',
+                               elapsed * 1000, endpoint, ' '.join(statement.split())[:500])
+
+
+def init_metrics(app):
+    """
+    Time requests, SQL and template rendering, and serve /metrics
+    Each worker keeps its own registry and writes it to METRICS_DIR at most
+    every METRICS_FLUSH_INTERVAL seconds and when it exits; /metrics sums
+    all workers' files and the archive of exited ones.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            _instrument_engine(app, engine)
+
+    state = {'flushed_at': 0.0}
+    flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+    # gunicorn workers leave through sys.exit, which runs atexit handlers
+    atexit.register(retire, app)
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+        g.sql_count = 0
+        g.sql_seconds = 0.0
+
+    @app.after_request
+    def _record_request(response):
+        if 'request_started' not in g:
+            return response
+        endpoint = _endpoint()
+        elapsed = time.perf_counter() - g.request_started
+        registry.inc('http_requests_total', [('endpoint', endpoint), ('method', request.method),
+                                             ('status', response.status_code)])
+        registry.observe('http_request_duration_seconds', elapsed, LATENCY_BUCKETS, [('endpoint', endpoint)])
+        registry.observe('http_request_sql_queries', g.sql_count, QUERY_COUNT_BUCKETS, [('endpoint', endpoint)])
+        registry.inc('http_request_sql_seconds_total', [('endpoint', endpoint)], g.sql_seconds)
+
+        now = time.monotonic()
+        if now - state['flushed_at'] >= flush_interval:
+            state['flushed_at'] = now
+            try:
+                flush(app)
+            except OSError as e:
+                app.logger.warning('could not write metrics: %s', e)
+        return response
+
+    def _template_started(sender, template, context, **extra):
+        if has_request_context():
+            g.setdefault('template_started', []).append(time.perf_counter())
+
+    def _template_done(sender, template, context, **extra):
+        if has_request_context() and g.get('template_started'):
+            elapsed = time.perf_counter() - g.template_started.pop()
+            registry.observe('template_render_seconds', elapsed, LATENCY_BUCKETS,
+                             [('template', template.name or 'string')])
+
+    before_render_template.connect(_template_started, app, weak=False)
+    template_rendered.connect(_template_done, app, weak=False)
+
+    @app.route('/metrics')
+    def metrics():
+        flush(app)
+        state['flushed_at'] = time.monotonic()
+        return Response(render(*collect(app)), mimetype='text/plain; version=0.0.4')
@@ -1,6 +1,7 @@
 from app import db
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import DDL, event, func, inspect, literal_column, select, text
+from app.passwords import password_hasher
 from flask_login import UserMixin
 
 class User(UserMixin, db.Model):
@@ -25,12 +26,12 @@ class User(UserMixin, db.Model):
         return self.username
     
     def set_password(self, password):
-        """Hash password before storing"""
-        self.hash_password = generate_password_hash(password)
+        """Hash password before storing (on the password pool; may raise HasherBusy)"""
+        self.hash_password = password_hasher.hash(password)
     
     def check_password(self, password):
-        """Verify password against hash"""
-        return check_password_hash(self.hash_password, password)
+        """Verify password against hash (on the password pool; may raise HasherBusy)"""
+        return password_hasher.verify(self.hash_password, password)
     
     @property
     def is_professor(self):
@@ -55,6 +56,21 @@ class Room(db.Model):
 
 class Reserve(db.Model):
     __tablename__ = 'reserves'
+    __table_args__ = (
+        # Approval queue: filter by status, newest first (keyset on reserve_id)
+        db.Index('ix_reserves_status_reserve_id', 'status', 'reserve_id'),
+        # Approval queue filters by room and/or date
+        db.Index('ix_reserves_room_book_date', 'room_id', 'book_date'),
+        db.Index('ix_reserves_book_date', 'book_date'),
+        # Expiry sweeper: WHERE status IN (...) AND end_time < now
+        db.Index('ix_reserves_status_end_time', 'status', 'end_time'),
+        # Conflict checks: room + status, range scan on start_time
+        db.Index('ix_reserves_room_status_start', 'room_id', 'status', 'start_time'),
+        # History: one user's rows, newest first (keyset on reserve_id)
+        db.Index('ix_reserves_reserve_by_id', 'reserve_by', 'reserve_id'),
+        # Incremental room calendar sync: changed since a sync token
+        db.Index('ix_reserves_room_changed_at', 'room_id', 'changed_at'),
+    )
     
     reserve_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     room_id = db.Column(db.String(7), db.ForeignKey('rooms.room_id'), nullable=False)
@@ -67,4 +83,185 @@ class Reserve(db.Model):
     reserve_date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
     start_time = db.Column(db.DateTime, nullable=False)
     end_time = db.Column(db.DateTime, nullable=False)
-    reason = db.Column(db.Text, nullable=True)
\ No newline at end of file
+    reason = db.Column(db.Text, nullable=True)
+    # Shared by every occurrence of a recurring booking (None for one-offs)
+    series_id = db.Column(db.String(36), nullable=True, index=True)
+    # Bumped by every UPDATE, ORM or Core (keys the rendered-row cache)
+    row_version = db.Column(db.Integer, nullable=False, default=1, server_default='1',
+                            onupdate=literal_column('row_version', db.Integer) + 1)
+    # Set on insert and by every UPDATE, ORM or Core (calendar sync tokens, UTC)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, server_default=func.now())
+
+class ReserveArchive(db.Model):
+    """
+    Terminal (Expired/Declined) reservations older than the archive horizon
+    Same columns as reserves; rows are moved by `flask archive-reservations`.
+    """
+    __tablename__ = 'reserves_archive'
+    __table_args__ = (
+        # History paging into the archive: one user's rows, newest first
+        db.Index('ix_reserves_archive_reserve_by_id', 'reserve_by', 'reserve_id'),
+        # Room/day rollup rebuilds
+        db.Index('ix_reserves_archive_room_book_date', 'room_id', 'book_date'),
+    )
+
+    reserve_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    room_id = db.Column(db.String(7), db.ForeignKey('rooms.room_id'), nullable=False)
+    book_date = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(10), nullable=False)
+    approve_by = db.Column(db.String(100), db.ForeignKey('users.username'), nullable=True)
+    approve_date = db.Column(db.Date, nullable=True)
+    reserve_by = db.Column(db.String(100), db.ForeignKey('users.username'), nullable=False)
+    reserve_date = db.Column(db.Date, nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    reason = db.Column(db.Text, nullable=True)
+    series_id = db.Column(db.String(36), nullable=True)
+    row_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    changed_at = db.Column(db.DateTime, nullable=False, server_default=func.now())
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    approver = db.relationship('User', foreign_keys=[approve_by])
+
+class RoomDayStat(db.Model):
+    """Per room, per day booking counters (kept up to date by utils.py)"""
+    __tablename__ = 'room_day_stats'
+
+    room_id = db.Column(db.String(), db.ForeignKey('rooms.room_id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    pending_count = db.Column(db.Integer, nullable=False, default=0)
+    approved_count = db.Column(db.Integer, nullable=False, default=0)
+    declined_count = db.Column(db.Integer, nullable=False, default=0)
+    expired_count = db.Column(db.Integer, nullable=False, default=0)
+    booked_minutes = db.Column(db.Integer, nullable=False, default=0)
+
+class CacheVersion(db.Model):
+    """Change counters shared by all workers, used to validate in-process caches"""
+    __tablename__ = 'cache_versions'
+
+    name = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class NotificationOutbox(db.Model):
+    """
+    Approval decisions waiting to be emailed to the person who booked
+    Written in the same transaction as the status change; drained in
+    batches by app/notifications.py, which deletes rows once sent.
+    """
+    __tablename__ = 'notification_outbox'
+    __table_args__ = (
+        # Drain order: due rows, oldest first
+        db.Index('ix_notification_outbox_due', 'next_attempt_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    recipient = db.Column(db.String(100), db.ForeignKey('users.username'), nullable=False)
+    # No foreign key: the reservation may be archived before this is sent
+    reserve_id = db.Column(db.Integer, nullable=False)
+    room_id = db.Column(db.String(7), nullable=False)
+    status = db.Column(db.String(10), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Failed sends back off exponentially; rows past NOTIFICATION_MAX_ATTEMPTS stay for inspection
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+
+# --- Postgres only: range overlap index + exclusion constraint ---
+# No two Approved bookings may overlap in the same room. This is enforced by
+# the database, so concurrent inserts/approvals can't both succeed.
+# (SQLite in dev/tests falls back to the btree index above.)
+RESERVE_RANGE_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    "CREATE INDEX IF NOT EXISTS ix_reserves_room_period ON reserves "
+    "USING gist (room_id, tsrange(start_time, end_time))",
+    "ALTER TABLE reserves ADD CONSTRAINT reserves_no_approved_overlap "
+    "EXCLUDE USING gist (room_id WITH =, tsrange(start_time, end_time) WITH &&) "
+    "WHERE (status = 'Approved')",
+]
+
+for statement in RESERVE_RANGE_DDL:
+    event.listen(Reserve.__table__, 'after_create',
+                 DDL(statement).execute_if(dialect='postgresql'))
+
+# --- Upgrading existing databases ---
+# db.create_all() creates missing tables (with their indexes) but never adds
+# columns or indexes to tables that already exist. `flask upgrade-db` runs
+# these after it on Postgres; each statement is a no-op once applied.
+SCHEMA_UPGRADE_DDL = [
+    # Recurring bookings
+    "ALTER TABLE reserves ADD COLUMN IF NOT EXISTS series_id varchar(36)",
+    # Rendered-row cache keys (existing rows start at version 1)
+    "ALTER TABLE reserves ADD COLUMN IF NOT EXISTS row_version integer NOT NULL DEFAULT 1",
+    "ALTER TABLE reserves_archive ADD COLUMN IF NOT EXISTS row_version integer NOT NULL DEFAULT 1",
+    # Calendar sync: existing rows count as changed when they were last reviewed or made
+    "ALTER TABLE reserves ADD COLUMN IF NOT EXISTS changed_at timestamp",
+    "UPDATE reserves SET changed_at = COALESCE(approve_date, reserve_date) WHERE changed_at IS NULL",
+    "ALTER TABLE reserves ALTER COLUMN changed_at SET DEFAULT now()",
+    "ALTER TABLE reserves ALTER COLUMN changed_at SET NOT NULL",
+    "ALTER TABLE reserves_archive ADD COLUMN IF NOT EXISTS changed_at timestamp",
+    "UPDATE reserves_archive SET changed_at = COALESCE(approve_date, reserve_date) WHERE changed_at IS NULL",
+    "ALTER TABLE reserves_archive ALTER COLUMN changed_at SET DEFAULT now()",
+    "ALTER TABLE reserves_archive ALTER COLUMN changed_at SET NOT NULL",
+    # Range overlap index (RESERVE_RANGE_DDL); the constraint comes last, see below
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    "CREATE INDEX IF NOT EXISTS ix_reserves_room_period ON reserves "
+    "USING gist (room_id, tsrange(start_time, end_time))",
+]
+
+# Added only when no Approved bookings overlap (the ALTER would fail on them)
+RESERVE_OVERLAP_CONSTRAINT_UPGRADE = (
+    "DO $$ BEGIN "
+    "IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'reserves_no_approved_overlap') THEN "
+    + RESERVE_RANGE_DDL[2] + "; "
+    "END IF; END $$"
+)
+
+def find_approved_overlaps(connection, limit=100):
+    """
+    Pairs of Approved bookings in the same room whose times overlap
+    What the exclusion constraint forbids; decline one of each pair before
+    adding it. Returns up to limit rows of
+    (room_id, reserve_id, start_time, other_reserve_id, other_start_time).
+    """
+    first, second = Reserve.__table__.alias('first'), Reserve.__table__.alias('second')
+    return connection.execute(
+        select(first.c.room_id, first.c.reserve_id, first.c.start_time,
+               second.c.reserve_id, second.c.start_time)
+        .join_from(first, second, (first.c.room_id == second.c.room_id)
+                   & (first.c.reserve_id < second.c.reserve_id)
+                   & (first.c.start_time < second.c.end_time)
+                   & (first.c.end_time > second.c.start_time))
+        .where(first.c.status == 'Approved', second.c.status == 'Approved')
+        .order_by(first.c.room_id, first.c.start_time)
+        .limit(limit)
+    ).all()
+
+def upgrade_schema():
+    """
+    Bring an existing database up to these models (safe to rerun)
+    Creates missing tables; on Postgres also runs SCHEMA_UPGRADE_DDL,
+    creates missing indexes and adds the no-approved-overlap constraint if
+    existing bookings allow it (SQLite dev databases are simply recreated).
+    Returns (names of the tables created, overlapping Approved pairs that
+    kept the constraint out - see find_approved_overlaps).
+    """
+    existing = set(inspect(db.engine).get_table_names())
+    db.create_all()
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as connection:
+            for statement in SCHEMA_UPGRADE_DDL:
+                connection.execute(text(statement))
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(connection, checkfirst=True)
+    overlaps = []
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as connection:
+            overlaps = find_approved_overlaps(connection)
+            if not overlaps:
+                connection.execute(text(RESERVE_OVERLAP_CONSTRAINT_UPGRADE))
+    created = [table.name for table in db.metadata.sorted_tables if table.name not in existing]
+    return created, overlaps
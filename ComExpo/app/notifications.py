@@ -0,0 +1,267 @@
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from flask import current_app
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.orm import Session
+from app import db
+from app.metrics import registry
+from app.models import NotificationOutbox, User
+
+# Decisions somebody else made about your booking
+NOTIFY_STATUSES = ('Approved', 'Declined')
+# Arbitrary key for pg_try_advisory_lock (see sweeper.LeaderLock)
+NOTIFIER_LOCK_KEY = 731002
+BATCH_SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# --- Outbox writes (request path) ---
+
+def queue_notifications(reservations):
+    """
+    Remember decision notifications for reservations changed in this session
+    Accepts Reserve objects or rows with the same column names. They are
+    written to notification_outbox with ONE insert inside the commit, so a
+    notification exists exactly when its status change does. Only the
+    latest change of a reservation in the transaction is kept.
+    """
+    pending = db.session.info.setdefault('outbox_dirty', {})
+    for reservation in reservations:
+        status = getattr(reservation, 'status', None)
+        reserve_by = getattr(reservation, 'reserve_by', None)
+        # Professors' own bookings are approved by themselves
+        if status not in NOTIFY_STATUSES or not reserve_by or getattr(reservation, 'approve_by', None) == reserve_by:
+            pending.pop(reservation.reserve_id, None)
+            continue
+        pending[reservation.reserve_id] = {
+            'recipient': reserve_by,
+            'reserve_id': reservation.reserve_id,
+            'room_id': reservation.room_id,
+            'status': status,
+            'start_time': reservation.start_time,
+            'end_time': reservation.end_time
+        }
+
+
+@event.listens_for(Session, 'before_commit')
+def _write_outbox_before_commit(session):
+    rows = session.info.pop('outbox_dirty', None)
+    if rows:
+        session.execute(insert(NotificationOutbox), list(rows.values()))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_outbox_after_rollback(session):
+    session.info.pop('outbox_dirty', None)
+
+
+# --- Sending (worker) ---
+
+def _connect(config):
+    smtp = smtplib.SMTP(config['SMTP_HOST'], config['SMTP_PORT'], timeout=config['SMTP_TIMEOUT'])
+    try:
+        if config['SMTP_STARTTLS']:
+            smtp.starttls()
+        if config['SMTP_USERNAME']:
+            smtp.login(config['SMTP_USERNAME'], config['SMTP_PASSWORD'])
+    except Exception:
+        smtp.close()
+        raise
+    return smtp
+
+
+def _line(row):
+    when = f"{row.start_time:%a %d %b %Y, %H:%M}-{row.end_time:%H:%M}"
+    return f'- {row.room_id}, {when}: {row.status}'
+
+
+def digest_message(recipient, name, rows, sender):
+    """One email listing every decision in rows (all for recipient), soonest booking first"""
+    rows = sorted(rows, key=lambda row: (row.start_time, row.reserve_id))
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = recipient
+    if len(rows) == 1:
+        row = rows[0]
+        message['Subject'] = f'RoomRak: {row.room_id} on {row.start_time:%d %b} was {row.status.lower()}'
+    else:
+        message['Subject'] = f'RoomRak: {len(rows)} of your bookings were reviewed'
+    body = [f'Hello {name or recipient},', '', 'Your booking requests have been reviewed:', '']
+    body.extend(_line(row) for row in rows)
+    if any(row.status == 'Declined' for row in rows):
+        body += ['', 'Declined requests usually overlap a booking that was approved first.',
+                 'You can look for a free room and request again.']
+    body += ['', 'RoomRak']
+    message.set_content('\n'.join(body))
+    return message
+
+
+def _claim(batch_size, max_attempts, lease, now):
+    due = (
+        select(NotificationOutbox.id)
+        .where(NotificationOutbox.next_attempt_at <= now, NotificationOutbox.attempts < max_attempts)
+        .order_by(NotificationOutbox.next_attempt_at, NotificationOutbox.id)
+        .limit(batch_size)
+    )
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # Concurrent drainers skip each other's rows while they claim them
+        due = due.with_for_update(skip_locked=True)
+    # The claim is the lease itself: nobody else sees the rows as due until it
+    # runs out, so no lock has to be held while sending. Counting the attempt
+    # here stops a row that crashes the sender from being claimed forever.
+    return db.session.execute(
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id.in_(due))
+        .values(attempts=NotificationOutbox.attempts + 1, next_attempt_at=now + timedelta(seconds=lease))
+        .returning(NotificationOutbox.id, NotificationOutbox.recipient, NotificationOutbox.reserve_id,
+                   NotificationOutbox.room_id, NotificationOutbox.status, NotificationOutbox.start_time,
+                   NotificationOutbox.end_time, NotificationOutbox.attempts)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+
+def send_batch(now=None):
+    """
+    Claim up to NOTIFICATION_BATCH_SIZE due outbox rows and email them
+    The claim commits at once, leasing the rows for NOTIFICATION_LEASE
+    seconds. The digests (one per recipient, over one SMTP connection) are
+    sent with no transaction open. A second short transaction deletes the
+    sent rows and reschedules the rows of a failed recipient (or all, if
+    the server can't be reached) after an exponential backoff. Delivery is
+    at-least-once: if the sender dies before that, its rows come back when
+    the lease runs out. Returns (rows claimed, rows sent, emails sent,
+    emails failed).
+    """
+    config = current_app.config
+    now = now or datetime.utcnow()
+    rows = _claim(config['NOTIFICATION_BATCH_SIZE'], config['NOTIFICATION_MAX_ATTEMPTS'],
+                  config['NOTIFICATION_LEASE'], now)
+    if not rows:
+        db.session.commit()
+        return 0, 0, 0, 0
+
+    by_recipient = {}
+    for row in rows:
+        by_recipient.setdefault(row.recipient, []).append(row)
+    names = dict(db.session.execute(
+        select(User.username, User.name).where(User.username.in_(by_recipient))
+    ).all())
+    db.session.commit()
+
+    sent, failed = [], {}
+    try:
+        smtp = _connect(config)
+    except (OSError, smtplib.SMTPException) as e:
+        failed = {recipient: str(e) for recipient in by_recipient}
+    else:
+        with smtp:
+            for recipient, recipient_rows in by_recipient.items():
+                # Several decisions on one reservation in the batch: report the latest
+                latest = {}
+                for row in sorted(recipient_rows, key=lambda row: row.id):
+                    latest[row.reserve_id] = row
+                message = digest_message(recipient, names.get(recipient), latest.values(), config['MAIL_FROM'])
+                try:
+                    smtp.send_message(message)
+                    sent.extend(row.id for row in recipient_rows)
+                except (OSError, smtplib.SMTPException) as e:
+                    failed[recipient] = str(e)
+
+    if sent:
+        db.session.execute(
+            delete(NotificationOutbox).where(NotificationOutbox.id.in_(sent))
+            .execution_options(synchronize_session=False)
+        )
+    retries = []
+    for recipient, error in failed.items():
+        for row in by_recipient[recipient]:
+            delay = min(config['NOTIFICATION_RETRY_MAX'], config['NOTIFICATION_RETRY_BASE'] * 2 ** (row.attempts - 1))
+            retries.append({'id': row.id, 'next_attempt_at': now + timedelta(seconds=delay),
+                            'last_error': error[:500]})
+    if retries:
+        # Bulk UPDATE by primary key, one statement
+        db.session.execute(update(NotificationOutbox), retries)
+    db.session.commit()
+    return len(rows), len(sent), len(by_recipient) - len(failed), len(failed)
+
+
+def outbox_backlog():
+    """Rows still waiting to be sent (excluding ones out of attempts)"""
+    return db.session.execute(
+        select(func.count()).select_from(NotificationOutbox)
+        .where(NotificationOutbox.attempts < current_app.config['NOTIFICATION_MAX_ATTEMPTS'])
+    ).scalar()
+
+
+def send_notifications(now=None, max_batches=None):
+    """
+    Drain the outbox: send batches until one comes back short
+    Records throughput in the metrics registry.
+    Returns (rows sent, emails sent, emails failed).
+    """
+    totals = [0, 0, 0]
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        started = time.perf_counter()
+        try:
+            claimed, rows_sent, emails_sent, emails_failed = send_batch(now)
+        except Exception:
+            db.session.rollback()
+            raise
+        batches += 1
+        if claimed:
+            registry.observe('notification_batch_seconds', time.perf_counter() - started, BATCH_SECONDS_BUCKETS)
+            registry.inc('notifications_sent_total', value=rows_sent)
+            registry.inc('notification_emails_total', [('result', 'sent')], emails_sent)
+            registry.inc('notification_emails_total', [('result', 'failed')], emails_failed)
+        totals = [totals[0] + rows_sent, totals[1] + emails_sent, totals[2] + emails_failed]
+        if claimed < current_app.config['NOTIFICATION_BATCH_SIZE']:
+            break
+    registry.set('notification_outbox_backlog', outbox_backlog())
+    return tuple(totals)
+
+
+# --- In-process worker ---
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def _notifier_loop(app, interval):
+    from app.sweeper import LeaderLock
+    leader = LeaderLock(app, key=NOTIFIER_LOCK_KEY, name='notifier')
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                if not leader.acquire():
+                    continue
+                rows, emails, failures = send_notifications()
+                if rows or failures:
+                    app.logger.info('notifications: %d decisions in %d emails, %d emails failed',
+                                    rows, emails, failures)
+            except Exception as e:
+                leader.release()
+                app.logger.warning('notification batch failed: %s', e)
+            finally:
+                db.session.remove()
+
+
+def start_notifier(app):
+    """
+    Start the in-process outbox drainer (once per worker process)
+    Enabled when NOTIFICATION_INTERVAL > 0; only the leader worker sends.
+    """
+    global _started
+    interval = app.config.get('NOTIFICATION_INTERVAL', 0)
+    if not interval or _started:
+        return
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    thread = threading.Thread(target=_notifier_loop, args=(app, interval),
+                              name='notifier', daemon=True)
+    thread.start()
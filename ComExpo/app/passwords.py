@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    """Too many password hashes are already queued in this worker, or one took too long"""
+
+
+class PasswordHasher:
+    """
+    Runs password hashing/verification on a small per-process thread pool
+    scrypt and pbkdf2 release the GIL, so the request thread just waits while
+    at most `workers` hashes run; the other gthread threads keep serving.
+    At most `max_pending` hashes may be running or queued: past that, callers
+    get HasherBusy immediately instead of piling up behind the pool. A caller
+    that waits longer than `timeout` gets HasherBusy too; its hash keeps its
+    slot until it has really finished, so the bound holds for abandoned ones.
+    """
+
+    def __init__(self, method='scrypt', workers=2, max_pending=32, timeout=10):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._method_prefix = None
+        self.busy = 0
+        self.configure(method, workers, max_pending, timeout)
+
+    def configure(self, method, workers, max_pending, timeout):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self.method = method
+            self.workers = workers
+            self.timeout = timeout
+            self._executor = None
+            self._method_prefix = None
+            self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+            return self._executor
+
+    def _refuse(self):
+        with self._lock:
+            self.busy += 1
+        return HasherBusy()
+
+    def _run(self, fn, *args):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise self._refuse()
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # Released when the hash is done (or cancelled), not when we stop waiting
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Still queued: drop it; already running: it finishes on its own
+            future.cancel()
+            raise self._refuse() from None
+
+    def hash(self, password):
+        """Hash with the configured method (PASSWORD_HASH_METHOD)"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """
+        True if password_hash was made with other parameters than the current method
+        Werkzeug stores the expanded method ('scrypt:32768:8:1', 'pbkdf2:sha256:600000')
+        before the first '$'; the current one is learned from one hash per process.
+        """
+        if self._method_prefix is None:
+            self._method_prefix = self.hash('').split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._method_prefix
+
+
+password_hasher = PasswordHasher()
+
+
+class LoginThrottle:
+    """
+    Per-process failed-login counter keyed by username and by client IP
+    A key with its limit of failures in the last `window` seconds is blocked
+    until the oldest of them ages out. Checked before any password hashing,
+    and blocked attempts are not counted, so a key never holds more than
+    its limit of timestamps.
+    Keeps at most max_keys keys (least recently failed are dropped).
+    """
+
+    def __init__(self, max_per_user=5, max_per_ip=20, window=300, max_keys=10000):
+        self.max_per_user = max_per_user
+        self.max_per_ip = max_per_ip
+        self.window = window
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._failures = OrderedDict()  # key -> deque of failure times
+        self.rejected = 0
+
+    def _limits(self, username, ip):
+        return ((f'user:{username}', self.max_per_user), (f'ip:{ip}', self.max_per_ip))
+
+    def _recent(self, key, now):
+        times = self._failures.get(key)
+        if times is None:
+            return 0
+        while times and now - times[0] >= self.window:
+            times.popleft()
+        if not times:
+            del self._failures[key]
+            return 0
+        return len(times)
+
+    def retry_after(self, username, ip):
+        """Seconds until this username/IP may try again, 0 if not blocked"""
+        now = time.monotonic()
+        with self._lock:
+            wait = 0
+            for key, limit in self._limits(username, ip):
+                if limit and self._recent(key, now) >= limit:
+                    wait = max(wait, self.window - (now - self._failures[key][0]))
+            if wait:
+                self.rejected += 1
+            return int(wait) + 1 if wait else 0
+
+    def failed(self, username, ip):
+        now = time.monotonic()
+        with self._lock:
+            for key, _ in self._limits(username, ip):
+                self._failures.setdefault(key, deque()).append(now)
+                self._failures.move_to_end(key)
+            while len(self._failures) > self.max_keys:
+                self._failures.popitem(last=False)
+
+    def succeeded(self, username):
+        # The IP keeps its count, so one good account can't reset a spray
+        with self._lock:
+            self._failures.pop(f'user:{username}', None)
+
+
+login_throttle = LoginThrottle()
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import queue
+import random
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import Blueprint, Response, current_app, jsonify, make_response, request
+from flask_login import current_user
+from app import db
+from app.models import Reserve
+from app.cache import get_version, room_catalog
+from app.availability import build_bands, find_free_slots
+from app.db_routing import read_only
+from app.metrics import registry
+from app.events import TooManyStreams, broker, start_listener
+from app.utils import get_approval_queue, get_user_bookings, overlaps
+
+api_bp = Blueprint('api', __name__)
+
+# Seconds between SSE comment lines that keep proxies from closing the stream
+SSE_KEEPALIVE = 15
+# Refused streams reconnect after this many seconds, plus up to as many again
+SSE_BUSY_RETRY = 30
+
+
+def api_login_required(*roles):
+    """
+    Like login_required_role, but answers 401/403 JSON instead of redirecting
+    Usage: @api_login_required() or @api_login_required('Professor')
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not current_user.is_authenticated:
+                return jsonify({'error': 'login required'}), 401
+            if roles and current_user.role not in roles:
+                return jsonify({'error': 'forbidden'}), 403
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+ETAG_TIME_FORMAT = '%Y%m%dT%H%M%S'
+
+
+def conditional_json(versions, build, *extra):
+    """
+    Serve build() as JSON with an ETag made from change-version counters
+    versions are cache_versions names; extra are request parameters that
+    change the body. When the client's If-None-Match still matches, answer
+    304 without calling build() (one primary-key lookup per version).
+    build() may return (body, valid_until) when the body also changes with
+    the clock (a Pending row passing its end time) before any version is
+    bumped: valid_until goes into the ETag, which matches until then.
+    """
+    parts = [f'{name}={get_version(name)}' for name in versions]
+    parts.extend(str(value) for value in extra)
+    digest = hashlib.sha1('|'.join(parts).encode()).hexdigest()[:20]
+
+    now = datetime.now()
+    for tag in request.if_none_match.as_set():
+        tag_digest, _, until = tag.partition('.')
+        if tag_digest == digest and (not until or now.strftime(ETAG_TIME_FORMAT) < until):
+            response = make_response('', 304)
+            response.set_etag(tag)
+            break
+    else:
+        body = build()
+        valid_until = None
+        if isinstance(body, tuple):
+            body, valid_until = body
+        response = jsonify(body)
+        response.set_etag(f'{digest}.{valid_until:{ETAG_TIME_FORMAT}}' if valid_until else digest)
+    # Clients may keep the body but must revalidate every time
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _booking_json(booking, now):
+    # Same rule as history.html: stale Pending rows read as Expired until swept
+    status = 'Expired' if booking.status == 'Pending' and booking.end_time < now else booking.status
+    return {
+        'reserve_id': booking.reserve_id,
+        'room_id': booking.room_id,
+        'book_date': booking.book_date.isoformat(),
+        'start_time': booking.start_time.isoformat(timespec='minutes'),
+        'end_time': booking.end_time.isoformat(timespec='minutes'),
+        'reason': booking.reason,
+        'status': status,
+        'series_id': booking.series_id
+    }
+
+
+def _next_expiry(bookings, now):
+    # When the first still-Pending booking shown ends, and the body with it
+    # (it reads as Expired, or leaves the queue); the sweeper's UPDATE then
+    # bumps the versions as well
+    return min((b.end_time for b in bookings if b.status == 'Pending' and b.end_time >= now), default=None)
+
+
+# ROUTE 1: Current user's bookings, newest first (?before=)
+@api_bp.route('/my-bookings')
+@api_login_required()
+@read_only
+def my_bookings():
+    now = datetime.now()
+    username = current_user.username
+    before_id = request.args.get('before', type=int)
+    per_page = current_app.config.get('BOOKINGS_PER_PAGE', 20)
+
+    def build():
+        bookings, next_before = get_user_bookings(username, now=now, before_id=before_id, limit=per_page)
+        body = {'bookings': [_booking_json(b, now) for b in bookings], 'next_before': next_before}
+        return body, _next_expiry(bookings, now)
+
+    return conditional_json([f'user:{username}'], build, before_id)
+
+
+# ROUTE 2: Professor approval queue (?room=&date=&before=)
+@api_bp.route('/pending')
+@api_login_required('Professor')
+def pending():
+    now = datetime.now()
+    room_id = request.args.get('room') or None
+    before_id = request.args.get('before', type=int)
+    per_page = current_app.config.get('BOOKINGS_PER_PAGE', 20)
+    try:
+        book_date = datetime.strptime(request.args['date'], '%Y-%m-%d').date() if request.args.get('date') else None
+    except ValueError:
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+
+    def build():
+        bookings, next_before = get_approval_queue(
+            status='Pending', room_id=room_id, date=book_date,
+            start_time=now, before_id=before_id, limit=per_page
+        )
+        body = {
+            'bookings': [dict(_booking_json(b, now), reserve_by=b.reserve_by, name=b.reserver.name)
+                         for b in bookings],
+            'next_before': next_before
+        }
+        return body, _next_expiry(bookings, now)
+
+    return conditional_json(['pending'], build, room_id, book_date, before_id)
+
+
+# ROUTE 3: Room metadata
+@api_bp.route('/rooms')
+@api_login_required()
+@read_only
+def rooms():
+    def build():
+        return {'rooms': [room._asdict() for room in room_catalog.all()]}
+
+    return conditional_json(['rooms'], build)
+
+
+# ROUTE 4: One room's schedule for a day (?date=YYYY-MM-DD, default today)
+@api_bp.route('/rooms/<room_id>/schedule')
+@api_login_required()
+@read_only
+def room_schedule(room_id):
+    if room_catalog.get(room_id) is None:
+        return jsonify({'error': 'room not found'}), 404
+    try:
+        day = datetime.strptime(request.args['date'], '%Y-%m-%d').date() if request.args.get('date') else datetime.now().date()
+    except ValueError:
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+
+    def build():
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+        rows = db.session.query(
+            Reserve.start_time, Reserve.end_time, Reserve.status
+        ).filter(
+            Reserve.room_id == room_id,
+            Reserve.status.in_(['Pending', 'Approved']),
+            overlaps(day_start, day_end)
+        ).order_by(Reserve.start_time).all()
+        return {
+            'room_id': room_id,
+            'date': day.isoformat(),
+            'bookings': [
+                {'start_time': start.isoformat(timespec='minutes'),
+                 'end_time': end.isoformat(timespec='minutes'),
+                 'status': status}
+                for start, end, status in rows
+            ],
+            'bands': [
+                {'start_time': band.start.isoformat(timespec='minutes'),
+                 'end_time': band.end.isoformat(timespec='minutes'),
+                 'state': band.state}
+                for band in build_bands(day_start, day_end, rows)
+            ]
+        }
+
+    return conditional_json([f'room:{room_id}'], build, day)
+
+
+# ROUTE 5: Rooms with a free slot (search)
+# ?date=YYYY-MM-DD&from=HH:MM&to=HH:MM&duration=<minutes>&chairs=&projector=1&computer=1&air_conditioner=&limit=
+@api_bp.route('/rooms/search')
+@api_login_required()
+@read_only
+def room_search():
+    args = request.args
+    try:
+        day = datetime.strptime(args['date'], '%Y-%m-%d').date() if args.get('date') else datetime.now().date()
+        day_start = datetime.combine(day, datetime.min.time())
+        window_start = datetime.strptime(f"{day} {args['from']}", '%Y-%m-%d %H:%M') if args.get('from') else day_start
+        window_end = datetime.strptime(f"{day} {args['to']}", '%Y-%m-%d %H:%M') if args.get('to') else day_start + timedelta(days=1)
+    except ValueError:
+        return jsonify({'error': 'date must be YYYY-MM-DD, from/to HH:MM'}), 400
+    duration = args.get('duration', 60, type=int)
+    if not duration or duration <= 0:
+        return jsonify({'error': 'duration must be a positive number of minutes'}), 400
+
+    slots = find_free_slots(
+        max(window_start, datetime.now().replace(second=0, microsecond=0)), window_end,
+        timedelta(minutes=duration),
+        min_chairs=args.get('chairs', 0, type=int),
+        projector=args.get('projector') in ('1', 'true'),
+        computer=args.get('computer') in ('1', 'true'),
+        air_conditioner=args.get('air_conditioner', 0, type=int),
+        limit=min(args.get('limit', 10, type=int), 50)
+    )
+    return jsonify({'slots': [
+        {'room': slot.room._asdict(),
+         'start_time': slot.start.isoformat(timespec='minutes'),
+         'end_time': slot.end.isoformat(timespec='minutes'),
+         'overlaps_pending': slot.pending}
+        for slot in slots
+    ]})
+
+
+# ROUTE 6: Server-Sent Events stream of reservation status changes
+# Students get their own reservations, professors also every queue change.
+@api_bp.route('/events')
+@api_login_required()
+def events():
+    channels = [f'user:{current_user.username}']
+    if current_user.role == 'Professor':
+        channels.append('pending')
+
+    start_listener(current_app._get_current_object())
+    try:
+        subscription = broker.subscribe(channels)
+    except TooManyStreams:
+        # Every stream holds one of this worker's threads: keep the rest for
+        # pages. Jittered, so refused clients don't all come back at once.
+        registry.inc('sse_streams_refused_total')
+        delay = SSE_BUSY_RETRY + random.randint(0, SSE_BUSY_RETRY)
+        return Response(f'retry: {delay * 1000}\n\n', 503, mimetype='text/event-stream',
+                        headers={'Retry-After': str(delay), 'Cache-Control': 'no-store'})
+
+    # The generator only reads the in-process queue: no database connection
+    # is held while the stream is open.
+    def stream():
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                item = subscription.get(timeout=SSE_KEEPALIVE)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield f"event: {item['type']}\ndata: {json.dumps(item)}\n\n"
+
+    response = Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # On close, not in the generator: a stream that never started still frees its slot
+    response.call_on_close(lambda: broker.unsubscribe(subscription, channels))
+    return response
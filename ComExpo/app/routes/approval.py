@@ -1,47 +1,104 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from flask_login import login_required, current_user
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
+from flask_login import current_user
 from app import db
 from app.models import Reserve
+from app.cache import room_catalog
 from app.auth import login_required_role
-from app.utils import cascade_decline_conflicts
+from app.db_routing import statement_timeout
+from app.utils import (approve_reservation, decline_reservation, get_approval_queue, is_overlap_violation,
+                       approve_reservation_series,
+                       decline_reservation_series, review_reservations, QUEUE_STATUSES)
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 
 approval_bp = Blueprint('approval', __name__)
 
 @approval_bp.route('/pending')
 @login_required_role('Professor')
+@statement_timeout(5000)
 def pending_requests():
-    # 1. Fetch ALL bookings
-    all_bookings = Reserve.query.order_by(Reserve.reserve_id.desc()).all()
-    
-    # 2. AUTO-EXPIRE LOGIC (For everyone)
+    # 1. Read filters from the query string (?status=&room=&date=&start=&end=&before=)
+    status = request.args.get('status', 'Pending')
+    if status not in QUEUE_STATUSES:
+        status = None  # 'all'
+    room_id = request.args.get('room') or None
+    date_str = request.args.get('date', '')
+    start_str = request.args.get('start', '')
+    end_str = request.args.get('end', '')
+    before_id = request.args.get('before', type=int)
+
+    book_date = start_dt = end_dt = None
+    try:
+        if date_str:
+            book_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+            # Time range only makes sense for a specific day
+            if start_str:
+                start_dt = datetime.strptime(f"{date_str} {start_str}", "%Y-%m-%d %H:%M")
+            if end_str:
+                end_dt = datetime.strptime(f"{date_str} {end_str}", "%Y-%m-%d %H:%M")
+    except ValueError:
+        flash('Invalid date or time filter.', 'danger')
+        book_date = start_dt = end_dt = None
+
+    # 2. Fetch ONE page of matching bookings (filtered + paginated in SQL)
+    # Read-only: stale Pending rows are expired by the sweeper (app/sweeper.py),
+    # until then keep them out of the actionable Pending tab and show them as
+    # Expired on the others.
     now = datetime.now()
-    data_changed = False
-    
-    for booking in all_bookings:
-        if booking.status == 'Pending' and booking.end_time < now:
-            booking.status = 'Expired'
-            data_changed = True
-            
-    if data_changed:
-        db.session.commit()
+    if status == 'Pending':
+        start_dt = max(start_dt, now) if start_dt else now
+
+    per_page = current_app.config.get('BOOKINGS_PER_PAGE', 20)
+    bookings, next_before = get_approval_queue(
+        status=status,
+        room_id=room_id,
+        date=book_date,
+        start_time=start_dt,
+        end_time=end_dt,
+        before_id=before_id,
+        limit=per_page
+    )
+
+    rooms = room_catalog.all()
+    filters = {
+        'status': status or 'all',
+        'room': room_id or '',
+        'date': date_str,
+        'start': start_str,
+        'end': end_str,
+    }
 
-    return render_template('approval/request.html', bookings=all_bookings)
+    return render_template('approval/request.html', bookings=bookings, rooms=rooms,
+                           filters=filters, next_before=next_before, now=now)
 
 @approval_bp.route('/approve/<int:reserve_id>', methods=['POST'])
 @login_required_role('Professor')
 def approve_request(reserve_id):
     reservation = Reserve.query.get_or_404(reserve_id)
     
-    # 1. Update Status
-    reservation.status = 'Approved'
-    reservation.approve_by = current_user.username
-    reservation.approve_date = datetime.utcnow().date()
-       
-    # 2. Automatically decline other students who wanted the same room/time
-    declined_count = cascade_decline_conflicts(reservation)
-     
-    db.session.commit()
+    try:
+        # 1. Lock the room, re-check, approve and decline the requests it beats
+        outcome, declined_count = approve_reservation(reservation, current_user.username)
+        db.session.commit()
+    except IntegrityError as e:
+        # Postgres exclusion constraint: another Approved booking overlaps
+        db.session.rollback()
+        if not is_overlap_violation(e):
+            raise
+        outcome = 'conflict'
+
+    if outcome == 'conflict':
+        db.session.rollback()
+        flash('Cannot approve: the room is already approved for another booking at this time.', 'danger')
+        return redirect(url_for('approval.pending_requests'))
+    if outcome == 'not_pending':
+        db.session.rollback()
+        flash('This request has already been reviewed.', 'warning')
+        return redirect(url_for('approval.pending_requests'))
+    if outcome == 'expired':
+        db.session.rollback()
+        flash('Cannot approve: this booking has already ended.', 'warning')
+        return redirect(url_for('approval.pending_requests'))
     
     flash(f'Request Approved! {declined_count} conflicting requests were automatically declined.', 'success')
     return redirect(url_for('approval.pending_requests'))
@@ -51,13 +108,88 @@ def approve_request(reserve_id):
 def decline_request(reserve_id):
     reservation = Reserve.query.get_or_404(reserve_id)
     
-    # 1. Update Status
-    reservation.status = 'Declined'
-    reservation.approve_by = current_user.username
-    reservation.approve_date = datetime.utcnow().date()
-    
+    # 1. Lock the room and decline it if nobody reviewed it meanwhile
+    outcome = decline_reservation(reservation, current_user.username)
+    if outcome == 'not_pending':
+        db.session.rollback()
+        flash('This request has already been reviewed.', 'warning')
+        return redirect(url_for('approval.pending_requests'))
+    if outcome == 'expired':
+        db.session.rollback()
+        flash('This booking has already ended; it will be marked Expired.', 'warning')
+        return redirect(url_for('approval.pending_requests'))
     db.session.commit()
     
     flash('Request Declined.', 'warning')
     return redirect(url_for('approval.pending_requests'))
 
+@approval_bp.route('/series/<series_id>/approve', methods=['POST'])
+@login_required_role('Professor')
+def approve_series(series_id):
+    # One UPDATE for the whole series + one UPDATE for the conflicts it wins
+    try:
+        approved_count, declined_count = approve_reservation_series(series_id, current_user.username)
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if not is_overlap_violation(e):
+            raise
+        flash('Cannot approve: part of this series overlaps another approved booking.', 'danger')
+        return redirect(url_for('approval.pending_requests'))
+
+    flash(f'Series Approved! {approved_count} bookings approved, {declined_count} conflicting requests were automatically declined.', 'success')
+    return redirect(url_for('approval.pending_requests'))
+
+@approval_bp.route('/series/<series_id>/decline', methods=['POST'])
+@login_required_role('Professor')
+def decline_series(series_id):
+    declined_count = decline_reservation_series(series_id, current_user.username)
+    db.session.commit()
+
+    flash(f'Series Declined. {declined_count} bookings were declined.', 'warning')
+    return redirect(url_for('approval.pending_requests'))
+
+@approval_bp.route('/bulk', methods=['POST'])
+@login_required_role('Professor')
+def bulk_review():
+    # Accepts the queue's checkbox form or JSON {"action": ..., "reserve_ids": [...]}
+    data = request.get_json(silent=True)
+    if data is not None:
+        action = data.get('action')
+        raw_ids = data.get('reserve_ids') or []
+    else:
+        action = request.form.get('action')
+        raw_ids = request.form.getlist('reserve_ids')
+
+    try:
+        reserve_ids = [int(reserve_id) for reserve_id in raw_ids]
+    except (TypeError, ValueError):
+        reserve_ids = None
+    if action not in ('approve', 'decline') or not reserve_ids:
+        if data is not None:
+            return jsonify({'error': 'action must be approve/decline and reserve_ids a list of ids'}), 400
+        flash('Select at least one request.', 'danger')
+        return redirect(url_for('approval.pending_requests'))
+
+    try:
+        outcomes = review_reservations(reserve_ids, action, current_user.username)
+        db.session.commit()
+    except IntegrityError as e:
+        # Postgres exclusion constraint: a concurrent approval got there first
+        db.session.rollback()
+        if not is_overlap_violation(e):
+            raise
+        if data is not None:
+            return jsonify({'error': 'conflicting approval in progress, retry'}), 409
+        flash('Another approval for the same room/time happened at the same moment. Please retry.', 'danger')
+        return redirect(url_for('approval.pending_requests'))
+
+    if data is not None:
+        return jsonify({'outcomes': {str(k): v for k, v in outcomes.items()}})
+
+    counts = {}
+    for outcome in outcomes.values():
+        counts[outcome] = counts.get(outcome, 0) + 1
+    summary = ', '.join(f'{count} {outcome.replace("_", " ")}' for outcome, count in sorted(counts.items()))
+    flash(f'Bulk {action}: {summary}.', 'success' if action == 'approve' else 'warning')
+    return redirect(url_for('approval.pending_requests'))
@@ -1,16 +1,22 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from flask_login import login_required, current_user
 from app import db
-from app.models import Room, Reserve
-from app.utils import validate_booking_time, cascade_decline_conflicts
+from app.cache import room_catalog
+from app.utils import (validate_booking_time, create_reservation, expand_occurrences,
+                       create_reservation_series)
+from app.availability import get_day_availability, find_free_slots
+from app.db_routing import read_only, statement_timeout
 from datetime import datetime, timedelta  # <--- 1. Import timedelta
 
 booking_bp = Blueprint('booking', __name__)
 
+# How far after the requested start to look for alternatives on a conflict
+SUGGESTION_WINDOW_HOURS = 12
+
 @booking_bp.route('/new', methods=['GET', 'POST'])
 @login_required
 def new_booking():
-    rooms = Room.query.all()
+    rooms = room_catalog.all()
     
     if request.method == 'POST':
         # 1. Get Data from Form
@@ -25,6 +31,12 @@ def new_booking():
             flash('Please fill in all fields.', 'danger')
             return render_template('booking/new_booking.html', rooms=rooms)
 
+        # O(1) lookup in the cached catalog (capacity/equipment live on it too)
+        room = room_catalog.get(room_id)
+        if room is None:
+            flash(f'Room {room_id} does not exist.', 'danger')
+            return render_template('booking/new_booking.html', rooms=rooms)
+
         try:
             # 3. Convert Strings to Python Objects
             start_dt = datetime.strptime(f"{date_str} {start_time_str}", "%Y-%m-%d %H:%M")
@@ -44,60 +56,29 @@ def new_booking():
                 flash(error_msg, 'danger')
                 return render_template('booking/new_booking.html', rooms=rooms)
 
-            # Check for conflicting APPROVED bookings
-            conflicting_approved = Reserve.query.filter(
-                Reserve.room_id == room_id,
-                Reserve.status == 'Approved',
-                Reserve.start_time < end_dt,
-                Reserve.end_time > start_dt
-            ).first()
+            # 6a. Recurring booking: every occurrence is checked and inserted at once
+            if request.form.get('repeat') == 'on':
+                return book_series(room_id, start_dt, end_dt, reason, rooms)
 
-            if conflicting_approved:
+            # 6. Conflict check + insert (+ cascade for professors) in ONE transaction
+            result = create_reservation(room_id, book_date, start_dt, end_dt, reason, current_user)
+
+            if result['approved_conflict']:
                 flash(f'Room {room_id} is already APPROVED for another class at this time.', 'danger')
-                return render_template('booking/new_booking.html', rooms=rooms)
+                # Same-size-or-bigger rooms with the same equipment, or this room later on
+                suggestions = find_free_slots(
+                    start_dt, start_dt + timedelta(hours=SUGGESTION_WINDOW_HOURS), end_dt - start_dt,
+                    min_chairs=room.chair, projector=room.projector, computer=room.computer, limit=5
+                )
+                return render_template('booking/new_booking.html', rooms=rooms,
+                                       suggestions=suggestions, reason=reason)
 
-            # Check for existing PENDING requests
-            pending_count = Reserve.query.filter(
-                Reserve.room_id == room_id,
-                Reserve.status == 'Pending',
-                Reserve.start_time < end_dt,
-                Reserve.end_time > start_dt
-            ).count()
-
-            # Determine Status
-            initial_status = 'Pending'
-            approver = None
-            approve_date_val = None
-            
-            if current_user.role == 'Professor':
-                initial_status = 'Approved'
-                approver = current_user.username
-                approve_date_val = datetime.utcnow().date()
-
-            # Save to Database
-            new_reservation = Reserve(
-                room_id=room_id,
-                book_date=book_date,
-                start_time=start_dt,
-                end_time=end_dt,
-                reason=reason,
-                reserve_by=current_user.username,
-                status=initial_status,
-                approve_by=approver,
-                approve_date=approve_date_val
-            )
-
-            db.session.add(new_reservation)
-            db.session.commit()
-            
             # Post-Booking Actions
-            if initial_status == 'Approved':
-                declined_count = cascade_decline_conflicts(new_reservation)
-                db.session.commit()
-                flash(f'Booking confirmed! (Auto-approved). {declined_count} other requests were declined.', 'success')
+            if result['status'] == 'Approved':
+                flash(f"Booking confirmed! (Auto-approved). {result['declined_count']} other requests were declined.", 'success')
             else:
-                if pending_count > 0:
-                    flash(f'Request submitted! Note: There are {pending_count} other pending requests for this slot.', 'warning')
+                if result['pending_count'] > 0:
+                    flash(f"Request submitted! Note: There are {result['pending_count']} other pending requests for this slot.", 'warning')
                 else:
                     flash('Booking request submitted successfully! Waiting for approval.', 'success')
 
@@ -112,7 +93,62 @@ def new_booking():
 
     return render_template('booking/new_booking.html', rooms=rooms)
 
+def book_series(room_id, start_dt, end_dt, reason, rooms):
+    """Handle the 'Repeat' part of the booking form"""
+    try:
+        until = datetime.strptime(request.form.get('repeat_until', ''), "%Y-%m-%d").date()
+        weekdays = [int(day) for day in request.form.getlist('repeat_days')]
+        exclude_dates = [
+            datetime.strptime(day.strip(), "%Y-%m-%d").date()
+            for day in request.form.get('exclude_dates', '').split(',') if day.strip()
+        ]
+    except ValueError:
+        flash('Invalid repeat settings. Use YYYY-MM-DD dates.', 'danger')
+        return render_template('booking/new_booking.html', rooms=rooms)
+
+    if until < start_dt.date() or until > start_dt.date() + timedelta(days=190):
+        flash('Repeat end date must be within one semester of the first booking.', 'danger')
+        return render_template('booking/new_booking.html', rooms=rooms)
+
+    try:
+        occurrences = expand_occurrences(start_dt, end_dt, until, weekdays, exclude_dates)
+    except ValueError as e:
+        # Too many occurrences: the message says how far the series can go
+        flash(str(e), 'danger')
+        return render_template('booking/new_booking.html', rooms=rooms)
+    if not occurrences:
+        flash('The repeat settings do not produce any bookings.', 'danger')
+        return render_template('booking/new_booking.html', rooms=rooms)
+
+    result = create_reservation_series(room_id, occurrences, reason, current_user)
+
+    if result['conflict_dates']:
+        dates = ', '.join(day.strftime('%d %b') for day in result['conflict_dates'][:10])
+        flash(f'Room {room_id} is already APPROVED on: {dates}. Exclude these dates and try again.', 'danger')
+        return render_template('booking/new_booking.html', rooms=rooms)
+
+    if result['status'] == 'Approved':
+        flash(f"{result['count']} weekly bookings confirmed! (Auto-approved). {result['declined_count']} other requests were declined.", 'success')
+    elif result['pending_count'] > 0:
+        flash(f"{result['count']} weekly booking requests submitted! Note: {result['pending_count']} other pending requests overlap them.", 'warning')
+    else:
+        flash(f"{result['count']} weekly booking requests submitted! Waiting for approval.", 'success')
+    return redirect(url_for('booking.new_booking'))
+
 @booking_bp.route('/rooms/<date>')
 @login_required
+@read_only
+@statement_timeout(5000)
 def view_rooms(date):
-    pass
\ No newline at end of file
+    try:
+        day = datetime.strptime(date, "%Y-%m-%d").date()
+    except ValueError:
+        flash('Invalid date format.', 'danger')
+        return redirect(url_for('booking.new_booking'))
+
+    # Free / pending / booked bands for every room (cached per date)
+    grid = get_day_availability(day, ttl=current_app.config.get('AVAILABILITY_CACHE_TTL', 60))
+    rooms = room_catalog.all()
+
+    return render_template('booking/rooms.html', rooms=rooms, grid=grid, day=day,
+                           prev_day=day - timedelta(days=1), next_day=day + timedelta(days=1))
\ No newline at end of file
@@ -0,0 +1,91 @@
+import hashlib
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, current_app, make_response, request, stream_with_context, url_for
+from flask_login import current_user
+from app.cache import feed_cache, get_version, room_catalog, user_cache
+from app.db_routing import read_only
+from app.ical import feed, feed_token, feed_username, parse_sync_token
+
+calendar_bp = Blueprint('calendar', __name__)
+
+
+def calendar_feed_url(room_id=None):
+    """
+    Template global: the current user's webcal:// feed URL
+    Their own reservations, or room_id's approved schedule.
+    """
+    token = feed_token(current_user.username)
+    if room_id is None:
+        url = url_for('calendar.user_feed', token=token, _external=True)
+    else:
+        url = url_for('calendar.room_feed', room_id=room_id, token=token, _external=True)
+    return 'webcal://' + url.split('://', 1)[1]
+
+
+def _caching(chunks, key):
+    # Pass the chunks through and keep the whole feed once it is complete
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    feed_cache.put(key, ''.join(parts))
+
+
+def conditional_feed(kind, key, name):
+    """
+    Serve one ICS feed, full or incremental (?since=<sync token>)
+    The ETag and the cached body are keyed by the feed's change version
+    (user:<username> / room:<room_id>, bumped with every change to its
+    reservations) and the day, which moves the window of past events.
+    Matching If-None-Match gets a 304 after one version lookup; a full feed
+    at an unchanged version is sent from feed_cache without querying.
+    """
+    since_token = request.args.get('since') or None
+    try:
+        since = parse_sync_token(since_token) if since_token else None
+    except ValueError:
+        return Response('invalid sync token\n', 400, mimetype='text/plain')
+
+    today = datetime.now().date()
+    window_start = datetime.combine(today - timedelta(days=current_app.config['CALENDAR_PAST_DAYS']),
+                                    datetime.min.time())
+    version = get_version(f'{kind}:{key}')
+    etag = hashlib.sha1(f'{kind}:{key}={version}|{today}|{since_token}'.encode()).hexdigest()[:20]
+
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        cache_key = (kind, key, version, today)
+        body = feed_cache.get(cache_key) if since is None else None
+        if body is None:
+            chunks = feed(kind, key, name, window_start, since)
+            if since is None:
+                chunks = _caching(chunks, cache_key)
+            # The request context (and its DB session) lives until the last chunk
+            body = stream_with_context(chunks)
+        response = Response(body, mimetype='text/calendar')
+    response.set_etag(etag)
+    # The URL is a credential: keep it out of shared caches, always revalidate
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# ROUTE 1: One user's bookings (pending requests as tentative events)
+@calendar_bp.route('/<token>/bookings.ics')
+@read_only
+def user_feed(token):
+    username = feed_username(token)
+    user = user_cache.get(username) if username else None
+    if user is None:
+        return Response('feed not found\n', 404, mimetype='text/plain')
+    return conditional_feed('user', username, f'RoomRak - {user.name}')
+
+
+# ROUTE 2: A room's approved schedule, for any user's token
+@calendar_bp.route('/<token>/rooms/<room_id>.ics')
+@read_only
+def room_feed(token, room_id):
+    username = feed_username(token)
+    if not username or user_cache.get(username) is None or room_catalog.get(room_id) is None:
+        return Response('feed not found\n', 404, mimetype='text/plain')
+    return conditional_feed('room', room_id, f'RoomRak - {room_id}')
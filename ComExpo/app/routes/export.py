@@ -0,0 +1,42 @@
+from flask import Blueprint, Response, request, stream_with_context, flash, redirect, url_for
+from app.auth import login_required_role
+from app.db_routing import read_only
+from app.export import EXPORT_FORMATS, export_reservations
+from app.utils import QUEUE_STATUSES
+from datetime import datetime
+
+export_bp = Blueprint('export', __name__)
+
+MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+@export_bp.route('/reservations')
+@login_required_role('Professor')
+@read_only
+def reservations():
+    # 1. Read filters (?format=csv|ndjson&start=&end=&room=&status=&user=&archived=1)
+    fmt = request.args.get('format', 'csv')
+    status = request.args.get('status') or None
+    try:
+        filters = {
+            'start_date': _parse_date(request.args.get('start')),
+            'end_date': _parse_date(request.args.get('end')),
+            'room_id': request.args.get('room') or None,
+            'status': status,
+            'username': request.args.get('user') or None
+        }
+    except ValueError:
+        filters = None
+    if fmt not in EXPORT_FORMATS or filters is None or (status and status not in QUEUE_STATUSES):
+        flash('Invalid export parameters.', 'danger')
+        return redirect(url_for('approval.pending_requests'))
+
+    # 2. Stream it; the request context (and its DB session) lives until the last chunk
+    chunks = export_reservations(fmt, filters, include_archive=bool(request.args.get('archived')))
+    filename = f"reservations-{datetime.now():%Y%m%d-%H%M}.{fmt}"
+    return Response(stream_with_context(chunks), mimetype=MIMETYPES[fmt], headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no'
+    })
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
@@ -1,31 +1,45 @@
-from flask import Blueprint, render_template, flash, redirect, url_for
+from flask import Blueprint, render_template, request, current_app
 from flask_login import login_required, current_user
-from app.models import Reserve
-from app import db
-from datetime import datetime # <--- Import this
+from app.db_routing import read_only, statement_timeout
+from app.utils import get_archived_bookings, get_user_bookings, get_user_status_counts, HISTORY_TABS
+from datetime import datetime
 
 history_bp = Blueprint('history', __name__)
 
 @history_bp.route('/my-bookings')
 @login_required
+@read_only
+@statement_timeout(5000)
 def my_bookings():
-    # 1. Fetch user's bookings
-    bookings = Reserve.query.filter_by(reserve_by=current_user.username).all()
-    
-    # 2. AUTO-EXPIRE LOGIC
-    # Get current time
-    now = datetime.now() 
-    data_changed = False
+    # Archived history is paged on demand (?archived=1&before=<reserve_id>)
+    if request.args.get('archived'):
+        return archived_bookings()
 
-    for booking in bookings:
-        # If booking is Pending AND the End Time has passed
-        if booking.status == 'Pending' and booking.end_time < now:
-            booking.status = 'Expired'
-            data_changed = True
-    
-    # 3. Save changes to Database if any updates happened
-    if data_changed:
-        db.session.commit()
+    # 1. Read the tab and page (?status=all|pending|approved|declined|expired&before=<reserve_id>)
+    tab = request.args.get('status', 'all')
+    if tab not in HISTORY_TABS:
+        tab = 'all'
+    before_id = request.args.get('before', type=int)
 
-    # 4. Render the page (now with updated statuses)
-    return render_template('history/history.html', bookings=bookings, user=current_user)
\ No newline at end of file
+    # 2. Read-only: stale Pending rows are expired by the sweeper (app/sweeper.py),
+    # the template and the tab filters treat them as Expired in the meantime.
+    now = datetime.now()
+
+    # 3. ONE page of the tab (filtered + ordered in SQL) and ONE grouped count query
+    per_page = current_app.config.get('BOOKINGS_PER_PAGE', 20)
+    bookings, next_before = get_user_bookings(current_user.username, tab, now, before_id, per_page)
+    counts = get_user_status_counts(current_user.username, now)
+
+    # 4. Render the page
+    return render_template('history/history.html', bookings=bookings, user=current_user, now=now,
+                           tab=tab, counts=counts, next_before=next_before)
+
+def archived_bookings():
+    per_page = current_app.config.get('BOOKINGS_PER_PAGE', 20)
+    bookings, next_before = get_archived_bookings(
+        current_user.username,
+        before_id=request.args.get('before', type=int),
+        limit=per_page
+    )
+    return render_template('history/history.html', bookings=bookings, user=current_user,
+                           now=datetime.now(), archived=True, next_before=next_before)
@@ -1,7 +1,11 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
+from sqlalchemy import text
 from app import db, login_manager
 from app.models import User
+from app.cache import feed_cache, fragment_cache, user_cache
+from app.passwords import HasherBusy, login_throttle, password_hasher
+from app.events import broker
 from datetime import datetime
 import re
 
@@ -10,7 +14,8 @@ main_bp = Blueprint('main', __name__)
 # --- REQUIRED: User Loader for Flask-Login ---
 @login_manager.user_loader
 def load_user(username):
-    return User.query.get(username)
+    # Served from the per-process user cache (no users query on most requests)
+    return user_cache.get(username)
 
 # --- ROUTE 1: Root URL ---
 @main_bp.route('/')
@@ -36,15 +41,38 @@ def login():
         password = request.form.get('password', '') 
         keep_logged_in = request.form.get('keepLoggedIn') == 'on'
         
+        # Refuse brute-force bursts before spending any hashing time on them
+        ip = request.remote_addr
+        retry_after = login_throttle.retry_after(email, ip)
+        if retry_after:
+            flash(f'Too many failed attempts. Please try again in {-(-retry_after // 60)} minute(s).', 'danger')
+            return render_template('auth/login.html'), 429, {'Retry-After': str(retry_after)}
+
         user = User.query.filter_by(username=email).first()
-        
-        if user and user.check_password(password):    
+
+        try:
+            # Hashing runs on the bounded password pool, not in this thread
+            valid = user is not None and user.check_password(password)
+        except HasherBusy:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('auth/login.html'), 503, {'Retry-After': '5'}
+
+        if valid:
+            try:
+                if password_hasher.needs_rehash(user.hash_password):
+                    # Hash parameters changed since this password was set: upgrade it now
+                    user.hash_password = password_hasher.hash(password)
+                    db.session.commit()
+            except HasherBusy:
+                pass  # upgrade on a later login
+            login_throttle.succeeded(email)
             login_user(user, remember=keep_logged_in)
             flash(f'Welcome back, {user.name}!', 'success')
             
             next_page = request.args.get('next')
             return redirect(next_page or url_for('main.home'))
         else:
+            login_throttle.failed(email, ip)
             flash('Invalid email or password.', 'danger')
             
     return render_template('auth/login.html')
@@ -107,6 +135,10 @@ def register():
             flash('Registration successful! Please log in.', 'success')
             return redirect(url_for('main.login'))
             
+        except HasherBusy:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('auth/register.html'), 503, {'Retry-After': '5'}
+
         except Exception as e:
             db.session.rollback()
             flash('An error occurred. This email or Student ID might already be registered.', 'danger')
@@ -118,4 +150,21 @@ def register():
 # --- ROUTE 6: About Us ---
 @main_bp.route('/about-us')
 def about_us():
-    return render_template('aboutus.html', user=current_user)
\ No newline at end of file
+    return render_template('aboutus.html', user=current_user)
+
+# --- ROUTE 7: Health Check ---
+@main_bp.route('/health')
+def health():
+    try:
+        db.session.execute(text('SELECT 1'))
+        database = 'connected'
+    except Exception:
+        database = 'unavailable'
+    return jsonify({
+        'status': 'healthy' if database == 'connected' else 'degraded',
+        'database': database,
+        'app': 'Classroom Booking System',
+        'caches': {'users': user_cache.stats(), 'fragments': fragment_cache.stats(),
+                   'calendar_feeds': feed_cache.stats()},
+        'events': {'subscribers': broker.subscriber_count(), 'max_streams': broker.max_streams}
+    })
\ No newline at end of file
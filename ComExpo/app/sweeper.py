@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import text
+from app import db
+from app.utils import mark_completed_bookings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Arbitrary key for pg_try_advisory_lock, shared by every gunicorn worker
+SWEEPER_LOCK_KEY = 731001
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def run_sweep(now=None):
+    """
+    Expire stale reservations in one UPDATE and commit
+    Returns (rows_changed, elapsed_ms)
+    """
+    started = time.perf_counter()
+    try:
+        count = mark_completed_bookings(now or datetime.now())
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return count, elapsed_ms
+
+
+class LeaderLock:
+    """
+    Single-leader lock across worker processes
+    Postgres: session advisory lock held on a dedicated connection.
+    Other databases (SQLite in dev): flock on a file in the instance folder.
+    The lock is held for the life of the process, so if the leader dies
+    another worker takes over on its next tick. key/name tell apart the
+    background tasks that each elect their own leader.
+    """
+
+    def __init__(self, app, key=SWEEPER_LOCK_KEY, name='expiry-sweeper'):
+        self.app = app
+        self.key = key
+        self.name = name
+        self._conn = None
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._conn is not None or self._fd is not None
+
+    def acquire(self):
+        if self.held:
+            return True
+        if db.engine.dialect.name == 'postgresql':
+            conn = db.engine.connect()
+            got = conn.execute(text('SELECT pg_try_advisory_lock(:key)'),
+                               {'key': self.key}).scalar()
+            conn.commit()  # lock is session-level; don't sit idle in a transaction
+            if got:
+                self._conn = conn
+            else:
+                conn.close()
+            return bool(got)
+
+        if fcntl is None:
+            return True  # single process on Windows dev machines
+        os.makedirs(self.app.instance_path, exist_ok=True)
+        fd = os.open(os.path.join(self.app.instance_path, f'{self.name}.lock'),
+                     os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()  # closing the session drops the advisory lock
+            except Exception:
+                pass
+            self._conn = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def _sweeper_loop(app, interval):
+    leader = LeaderLock(app)
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                if not leader.acquire():
+                    continue
+                count, elapsed_ms = run_sweep()
+                if count:
+                    app.logger.info('expiry sweep: %d reservations expired in %.1f ms',
+                                    count, elapsed_ms)
+            except Exception as e:
+                # Drop leadership so a broken connection doesn't wedge the sweeper
+                leader.release()
+                app.logger.warning('expiry sweep failed: %s', e)
+            finally:
+                db.session.remove()
+
+
+def start_sweeper(app):
+    """
+    Start the in-process periodic sweeper (once per worker process)
+    Enabled when EXPIRY_SWEEP_INTERVAL > 0 (the default); only the leader
+    worker sweeps.
+    """
+    global _started
+    interval = app.config.get('EXPIRY_SWEEP_INTERVAL', 0)
+    if not interval or _started:
+        return
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    thread = threading.Thread(target=_sweeper_loop, args=(app, interval),
+                              name='expiry-sweeper', daemon=True)
+    thread.start()
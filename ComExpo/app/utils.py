@@ -1,6 +1,37 @@
-from app.models import Reserve, Room
+from app import db
+from app.models import Reserve, ReserveArchive, Room, RoomDayStat
+from app.availability import mark_dirty
+from app.cache import bump_versions
+from app.events import queue_events
+from app.notifications import queue_notifications
+import uuid
 from datetime import datetime, timedelta
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, case, cast, delete, event, exists, func, insert, literal, select, tuple_, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased, joinedload
+
+QUEUE_STATUSES = ('Pending', 'Approved', 'Declined', 'Expired')
+# Statuses that never change again; only these are archived
+ARCHIVE_STATUSES = ('Expired', 'Declined')
+MAX_SERIES_OCCURRENCES = 120
+
+# RETURNING columns for set-based writes, as record_reservation_changes expects
+CHANGED_COLUMNS = (Reserve.reserve_id, Reserve.room_id, Reserve.book_date, Reserve.start_time,
+                   Reserve.end_time, Reserve.reserve_by, Reserve.status, Reserve.approve_by)
+
+def overlaps(start_time, end_time, entity=Reserve):
+    """
+    SQL condition: reservation overlaps the [start_time, end_time) slot
+    Postgres compares tsranges so the GiST index on
+    (room_id, tsrange(start_time, end_time)) is used; other databases get
+    a plain two-sided comparison the (room_id, status, start_time) index serves.
+    start_time/end_time may be values or columns; entity may be an alias.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        return func.tsrange(entity.start_time, entity.end_time).op('&&')(
+            func.tsrange(start_time, end_time))
+    return and_(entity.start_time < end_time, entity.end_time > start_time)
 
 def check_room_availability(room_id, start_time, end_time, exclude_reserve_id=None):
     """
@@ -10,17 +41,13 @@ def check_room_availability(room_id, start_time, end_time, exclude_reserve_id=No
     query = Reserve.query.filter(
         Reserve.room_id == room_id,
         Reserve.status.in_(['Pending', 'Approved']),
-        or_(
-            and_(Reserve.start_time <= start_time, Reserve.end_time > start_time),
-            and_(Reserve.start_time < end_time, Reserve.end_time >= end_time),
-            and_(Reserve.start_time >= start_time, Reserve.end_time <= end_time)
-        )
+        overlaps(start_time, end_time)
     )
     
     if exclude_reserve_id:
         query = query.filter(Reserve.reserve_id != exclude_reserve_id)
     
-    return query.count() == 0
+    return query.first() is None
 
 def get_conflicting_reservations(room_id, start_time, end_time, exclude_reserve_id=None):
     """
@@ -29,11 +56,7 @@ def get_conflicting_reservations(room_id, start_time, end_time, exclude_reserve_
     query = Reserve.query.filter(
         Reserve.room_id == room_id,
         Reserve.status == 'Pending',
-        or_(
-            and_(Reserve.start_time <= start_time, Reserve.end_time > start_time),
-            and_(Reserve.start_time < end_time, Reserve.end_time >= end_time),
-            and_(Reserve.start_time >= start_time, Reserve.end_time <= end_time)
-        )
+        overlaps(start_time, end_time)
     )
     
     if exclude_reserve_id:
@@ -41,61 +64,793 @@ def get_conflicting_reservations(room_id, start_time, end_time, exclude_reserve_
     
     return query.all()
 
+def lock_rooms(room_ids):
+    """
+    Serialize check-then-write per room until the transaction ends
+    Postgres: row locks (FOR NO KEY UPDATE) on the rooms, taken in room_id
+    order so two writers never wait on each other in a cycle; writes to
+    other rooms go ahead in parallel. SQLite has no row locks and only
+    starts a transaction at the first write, so a no-op UPDATE takes the
+    database write lock instead (SQLite has one writer at a time anyway).
+    Call before reading the rows the write depends on.
+    """
+    room_ids = sorted(set(room_ids))
+    if not room_ids:
+        return
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(
+            select(Room.room_id).where(Room.room_id.in_(room_ids))
+            .order_by(Room.room_id).with_for_update(key_share=True)
+        ).all()
+    else:
+        db.session.execute(
+            update(Room).where(Room.room_id.in_(room_ids)).values(room_id=Room.room_id)
+            .execution_options(synchronize_session=False)
+        )
+
+def lock_reservation_rooms(condition):
+    """lock_rooms for the rooms of the reservations matching condition (one query)"""
+    lock_rooms(room_id for (room_id,) in db.session.query(Reserve.room_id).filter(condition).distinct())
+
+def approve_reservation(reservation, approver):
+    """
+    Approve one reservation and decline the Pending requests it beats
+    The room is locked first, then the reservation is re-read and checked
+    against Approved bookings under the lock, so two professors approving
+    overlapping requests can't both win. Caller commits.
+    Returns (outcome, declined_count), outcome one of 'approved',
+    'not_pending', 'expired' (ended, waiting for the sweeper) or 'conflict'
+    """
+    lock_rooms([reservation.room_id])
+    db.session.refresh(reservation)
+    if reservation.status != 'Pending':
+        return 'not_pending', 0
+    if reservation.end_time <= datetime.now():
+        return 'expired', 0
+
+    conflict = db.session.query(
+        exists().where(
+            Reserve.room_id == reservation.room_id,
+            Reserve.status == 'Approved',
+            Reserve.reserve_id != reservation.reserve_id,
+            overlaps(reservation.start_time, reservation.end_time)
+        )
+    ).scalar()
+    if conflict:
+        return 'conflict', 0
+
+    reservation.status = 'Approved'
+    reservation.approve_by = approver
+    reservation.approve_date = datetime.utcnow().date()
+    declined_count = cascade_decline_conflicts(reservation)
+    record_reservation_changes([reservation])
+    return 'approved', declined_count
+
+def decline_reservation(reservation, approver):
+    """
+    Decline one reservation if it is still Pending (room locked, re-read)
+    and has not ended. Caller commits.
+    Returns 'declined', 'not_pending' or 'expired'
+    """
+    lock_rooms([reservation.room_id])
+    db.session.refresh(reservation)
+    if reservation.status != 'Pending':
+        return 'not_pending'
+    if reservation.end_time <= datetime.now():
+        return 'expired'
+    reservation.status = 'Declined'
+    reservation.approve_by = approver
+    reservation.approve_date = datetime.utcnow().date()
+    record_reservation_changes([reservation])
+    return 'declined'
+
 def cascade_decline_conflicts(approved_reservation):
     """
     Automatically decline all conflicting pending reservations
-    when a reservation is approved
+    when a reservation is approved (ONE UPDATE ... WHERE EXISTS)
+    Locks the room, so it is safe to call outside approve_reservation.
     """
-    conflicts = get_conflicting_reservations(
-        approved_reservation.room_id,
-        approved_reservation.start_time,
-        approved_reservation.end_time,
-        approved_reservation.reserve_id
+    lock_rooms([approved_reservation.room_id])
+    declined = decline_pending_overlapping(
+        lambda approved: approved.reserve_id == approved_reservation.reserve_id,
+        approved_reservation.approve_by
     )
-    
-    for conflict in conflicts:
-        conflict.status = 'Declined'
-        conflict.approve_by = approved_reservation.approve_by
-        conflict.approve_date = datetime.utcnow().date()
-    
-    return len(conflicts)
+    return len(declined)
 
-def get_room_statistics(room_id, date):
+def record_reservation_changes(reservations):
     """
-    Get booking statistics for a room on a specific date
-    Returns dict with pending_count and approved_count
+    Call for every reservation inserted or changed, before committing
+    Accepts Reserve objects or rows with the same column names.
+    The room/day rollup is refreshed inside the commit; cached availability
+    for the affected days is dropped once the commit succeeds. Approvals and
+    declines are written to the notification outbox in the same commit.
+    """
+    room_days = db.session.info.setdefault('room_days_dirty', set())
+    versions = db.session.info.setdefault('versions_dirty', set())
+    for reservation in reservations:
+        room_days.add((reservation.room_id, reservation.book_date))
+        mark_dirty(reservation.start_time, reservation.end_time)
+        # Change versions behind the JSON API's ETags
+        versions.add(f'room:{reservation.room_id}')
+        if getattr(reservation, 'reserve_by', None):
+            versions.add(f'user:{reservation.reserve_by}')
+    if versions:
+        versions.add('pending')
+    queue_events(reservations)
+    queue_notifications(reservations)
+
+def is_overlap_violation(error):
+    """True if an IntegrityError came from the no-approved-overlap constraint"""
+    return getattr(getattr(error, 'orig', None), 'pgcode', None) == '23P01'
+
+def create_reservation(room_id, book_date, start_time, end_time, reason, user):
+    """
+    Check conflicts and insert a reservation in ONE transaction
+    The room is locked, then a single aggregate query returns the
+    approved-conflict count and the pending count. Professors' bookings are
+    auto-approved and cascade declines in the same transaction. On Postgres
+    the exclusion constraint is a second line of defence.
+    Returns dict with reservation, status, approved_conflict, pending_count, declined_count
     """
-    pending = Reserve.query.filter(
+    result = {
+        'reservation': None,
+        'status': None,
+        'approved_conflict': False,
+        'pending_count': 0,
+        'declined_count': 0
+    }
+
+    lock_rooms([room_id])
+    approved_count, pending_count = db.session.query(
+        func.count(case((Reserve.status == 'Approved', 1))),
+        func.count(case((Reserve.status == 'Pending', 1)))
+    ).filter(
         Reserve.room_id == room_id,
-        Reserve.book_date == date,
-        Reserve.status == 'Pending'
-    ).count()
-    
-    approved = Reserve.query.filter(
+        Reserve.status.in_(['Pending', 'Approved']),
+        overlaps(start_time, end_time)
+    ).one()
+
+    if approved_count:
+        db.session.rollback()
+        result['approved_conflict'] = True
+        return result
+
+    reservation = Reserve(
+        room_id=room_id,
+        book_date=book_date,
+        start_time=start_time,
+        end_time=end_time,
+        reason=reason,
+        reserve_by=user.username,
+        status='Pending'
+    )
+    if user.role == 'Professor':
+        reservation.status = 'Approved'
+        reservation.approve_by = user.username
+        reservation.approve_date = datetime.utcnow().date()
+
+    result['status'] = reservation.status
+
+    try:
+        db.session.add(reservation)
+        db.session.flush()
+        if reservation.status == 'Approved':
+            result['declined_count'] = cascade_decline_conflicts(reservation)
+        record_reservation_changes([reservation])
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if not is_overlap_violation(e):
+            raise
+        result['approved_conflict'] = True
+        return result
+
+    result['reservation'] = reservation
+    result['pending_count'] = pending_count
+    return result
+
+def expand_occurrences(start_time, end_time, until, weekdays=None, exclude_dates=()):
+    """
+    Expand a recurring booking into (start, end) pairs
+    Repeats on the given weekdays (0=Monday) up to and including the
+    until date, skipping exclude_dates. Default: weekly on start's weekday.
+    Raises ValueError if that is more than MAX_SERIES_OCCURRENCES bookings.
+    """
+    weekdays = set(weekdays) if weekdays else {start_time.weekday()}
+    exclude_dates = set(exclude_dates)
+    duration = end_time - start_time
+
+    occurrences = []
+    day = start_time.date()
+    while day <= until:
+        if day.weekday() in weekdays and day not in exclude_dates:
+            if len(occurrences) == MAX_SERIES_OCCURRENCES:
+                raise ValueError(f'A repeating booking can have at most {MAX_SERIES_OCCURRENCES} bookings: '
+                                 f'with these days, repeat until {occurrences[-1][0]:%d %b %Y} at the latest.')
+            start = datetime.combine(day, start_time.time())
+            occurrences.append((start, start + duration))
+        day += timedelta(days=1)
+    return occurrences
+
+def decline_pending_overlapping(approved_filter, approver):
+    """
+    Decline every Pending reservation that overlaps an Approved reservation
+    matched by approved_filter(alias) in ONE UPDATE ... WHERE EXISTS
+    Returns the declined rows (CHANGED_COLUMNS)
+    """
+    approved = aliased(Reserve)
+    declined = db.session.execute(
+        update(Reserve)
+        .where(
+            Reserve.status == 'Pending',
+            exists().where(
+                approved_filter(approved),
+                approved.status == 'Approved',
+                approved.room_id == Reserve.room_id,
+                approved.reserve_id != Reserve.reserve_id,
+                overlaps(Reserve.start_time, Reserve.end_time, entity=approved)
+            )
+        )
+        .values(status='Declined', approve_by=approver, approve_date=datetime.utcnow().date())
+        .returning(*CHANGED_COLUMNS)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    record_reservation_changes(declined)
+    return declined
+
+def create_reservation_series(room_id, occurrences, reason, user):
+    """
+    Book every occurrence of a recurring booking in ONE transaction
+    All occurrences are checked with one interval query and inserted with
+    one bulk INSERT sharing a series_id. Any overlap with an Approved
+    booking rejects the whole series.
+    Returns dict with series_id, status, count, conflict_dates, pending_count, declined_count
+    """
+    result = {
+        'series_id': None,
+        'status': 'Approved' if user.role == 'Professor' else 'Pending',
+        'count': 0,
+        'conflict_dates': [],
+        'pending_count': 0,
+        'declined_count': 0
+    }
+    if not occurrences:
+        return result
+
+    # ONE query (under the room lock): everything live in this room within the series' span
+    lock_rooms([room_id])
+    existing = db.session.query(
+        Reserve.start_time, Reserve.end_time, Reserve.status
+    ).filter(
         Reserve.room_id == room_id,
-        Reserve.book_date == date,
-        Reserve.status == 'Approved'
-    ).count()
-    
+        Reserve.status.in_(['Pending', 'Approved']),
+        overlaps(occurrences[0][0], occurrences[-1][1])
+    ).order_by(Reserve.start_time).all()
+
+    # Both lists are sorted by start: walk them together
+    conflict_dates = []
+    pending = set()
+    first = 0
+    for start, end in occurrences:
+        while first < len(existing) and existing[first].end_time <= start:
+            first += 1
+        i = first
+        while i < len(existing) and existing[i].start_time < end:
+            if existing[i].end_time > start:
+                if existing[i].status == 'Approved':
+                    conflict_dates.append(start.date())
+                else:
+                    pending.add(i)
+            i += 1
+
+    if conflict_dates:
+        db.session.rollback()
+        result['conflict_dates'] = sorted(set(conflict_dates))
+        return result
+
+    series_id = str(uuid.uuid4())
+    approved = result['status'] == 'Approved'
+    today = datetime.utcnow().date()
+    rows = [{
+        'room_id': room_id,
+        'book_date': start.date(),
+        'start_time': start,
+        'end_time': end,
+        'reason': reason,
+        'reserve_by': user.username,
+        'status': result['status'],
+        'approve_by': user.username if approved else None,
+        'approve_date': today if approved else None,
+        'series_id': series_id
+    } for start, end in occurrences]
+
+    try:
+        inserted = db.session.execute(
+            insert(Reserve).returning(*CHANGED_COLUMNS),
+            rows
+        ).all()
+        record_reservation_changes(inserted)
+        if approved:
+            declined = decline_pending_overlapping(
+                lambda a: a.series_id == series_id, user.username)
+            result['declined_count'] = len(declined)
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if not is_overlap_violation(e):
+            raise
+        result['conflict_dates'] = [start.date() for start, end in occurrences]
+        return result
+
+    result['series_id'] = series_id
+    result['count'] = len(rows)
+    result['pending_count'] = len(pending)
+    return result
+
+def approve_reservation_series(series_id, approver):
+    """
+    Approve every Pending occurrence of a series with ONE UPDATE
+    Occurrences that have ended are left to the sweeper; ones that overlap
+    an already Approved booking stay Pending;
+    Pending requests overlapping the newly approved ones are declined with
+    one more UPDATE. Caller commits.
+    Returns (approved_count, declined_count)
+    """
+    lock_reservation_rooms(Reserve.series_id == series_id)
+    other = aliased(Reserve)
+    approved = db.session.execute(
+        update(Reserve)
+        .where(
+            Reserve.series_id == series_id,
+            Reserve.status == 'Pending',
+            Reserve.end_time > datetime.now(),
+            ~exists().where(
+                other.status == 'Approved',
+                other.room_id == Reserve.room_id,
+                overlaps(Reserve.start_time, Reserve.end_time, entity=other)
+            )
+        )
+        .values(status='Approved', approve_by=approver, approve_date=datetime.utcnow().date())
+        .returning(*CHANGED_COLUMNS)
+        .execution_options(synchronize_session=False)
+    ).all()
+    record_reservation_changes(approved)
+
+    declined = decline_pending_overlapping(lambda a: a.series_id == series_id, approver)
+    return len(approved), len(declined)
+
+def decline_reservation_series(series_id, approver):
+    """
+    Decline every Pending occurrence of a series that has not ended, with
+    ONE UPDATE. Caller commits. Returns the number declined.
+    """
+    lock_reservation_rooms(Reserve.series_id == series_id)
+    declined = db.session.execute(
+        update(Reserve)
+        .where(Reserve.series_id == series_id, Reserve.status == 'Pending',
+               Reserve.end_time > datetime.now())
+        .values(status='Declined', approve_by=approver, approve_date=datetime.utcnow().date())
+        .returning(*CHANGED_COLUMNS)
+        .execution_options(synchronize_session=False)
+    ).all()
+    record_reservation_changes(declined)
+    return len(declined)
+
+def review_reservations(reserve_ids, action, approver):
+    """
+    Approve or decline many reservations in ONE transaction
+    Approvals are granted in reserve_id order (first come, first served);
+    a selected request that overlaps an Approved booking or an earlier
+    selected one is not approved. Pending requests that lose to the newly
+    approved ones are declined with one UPDATE ... WHERE EXISTS.
+    Caller commits.
+    Returns {reserve_id: outcome}, outcome one of 'approved', 'declined',
+    'conflict' (left Pending), 'not_pending', 'expired' (ended, left to the
+    sweeper), 'not_found'
+    """
+    reserve_ids = sorted(set(reserve_ids))
+    outcomes = {reserve_id: 'not_found' for reserve_id in reserve_ids}
+    if not reserve_ids:
+        return outcomes
+
+    # Lock the rooms involved, then read the selection under the locks
+    lock_reservation_rooms(Reserve.reserve_id.in_(reserve_ids))
+    selected = db.session.query(
+        Reserve.reserve_id, Reserve.room_id, Reserve.start_time, Reserve.end_time, Reserve.status
+    ).filter(Reserve.reserve_id.in_(reserve_ids)).order_by(Reserve.reserve_id).all()
+
+    now = datetime.now()
+    candidates = []
+    for row in selected:
+        if row.status != 'Pending':
+            outcomes[row.reserve_id] = 'not_pending'
+        elif row.end_time <= now:
+            outcomes[row.reserve_id] = 'expired'
+        else:
+            candidates.append(row)
+    if not candidates:
+        return outcomes
+
+    today = datetime.utcnow().date()
+
+    if action == 'decline':
+        declined = db.session.execute(
+            update(Reserve)
+            .where(Reserve.reserve_id.in_([row.reserve_id for row in candidates]),
+                   Reserve.status == 'Pending')
+            .values(status='Declined', approve_by=approver, approve_date=today)
+            .returning(*CHANGED_COLUMNS)
+            .execution_options(synchronize_session=False)
+        ).all()
+        record_reservation_changes(declined)
+        for row in declined:
+            outcomes[row.reserve_id] = 'declined'
+        return outcomes
+
+    # ONE query: Approved bookings in the selected rooms over the selected span
+    booked = {}
+    for row in db.session.query(Reserve.room_id, Reserve.start_time, Reserve.end_time).filter(
+        Reserve.status == 'Approved',
+        Reserve.room_id.in_({row.room_id for row in candidates}),
+        overlaps(min(row.start_time for row in candidates), max(row.end_time for row in candidates))
+    ):
+        booked.setdefault(row.room_id, []).append((row.start_time, row.end_time))
+
+    winners = []
+    for row in candidates:
+        taken = booked.setdefault(row.room_id, [])
+        if any(start < row.end_time and end > row.start_time for start, end in taken):
+            outcomes[row.reserve_id] = 'conflict'
+        else:
+            taken.append((row.start_time, row.end_time))
+            winners.append(row.reserve_id)
+
+    if winners:
+        approved = db.session.execute(
+            update(Reserve)
+            .where(Reserve.reserve_id.in_(winners), Reserve.status == 'Pending')
+            .values(status='Approved', approve_by=approver, approve_date=today)
+            .returning(*CHANGED_COLUMNS)
+            .execution_options(synchronize_session=False)
+        ).all()
+        record_reservation_changes(approved)
+        for row in approved:
+            outcomes[row.reserve_id] = 'approved'
+
+        declined = decline_pending_overlapping(
+            lambda approved: approved.reserve_id.in_(winners), approver)
+        for row in declined:
+            if row.reserve_id in outcomes:
+                outcomes[row.reserve_id] = 'declined'
+
+    return outcomes
+
+def get_approval_queue(status='Pending', room_id=None, date=None, start_time=None,
+                       end_time=None, before_id=None, limit=20):
+    """
+    Get one page of the professor approval queue, newest first
+    Filtering is done in SQL and pages are keyed on reserve_id (pass the
+    returned next_before as before_id to get the next page).
+    start_time/end_time are datetimes and only narrow the result when given.
+    Returns (bookings, next_before)
+    """
+    query = Reserve.query.options(
+        joinedload(Reserve.reserver),
+        joinedload(Reserve.approver)
+    )
+
+    if status:
+        query = query.filter(Reserve.status == status)
+    if room_id:
+        query = query.filter(Reserve.room_id == room_id)
+    if date:
+        query = query.filter(Reserve.book_date == date)
+    if start_time:
+        query = query.filter(Reserve.end_time > start_time)
+    if end_time:
+        query = query.filter(Reserve.start_time < end_time)
+    if before_id:
+        query = query.filter(Reserve.reserve_id < before_id)
+
+    # Fetch one extra row to know whether there is another page
+    bookings = query.order_by(Reserve.reserve_id.desc()).limit(limit + 1).all()
+
+    next_before = None
+    if len(bookings) > limit:
+        bookings = bookings[:limit]
+        next_before = bookings[-1].reserve_id
+
+    return bookings, next_before
+
+def upsert(model, rows, index_elements, update_columns):
+    """
+    INSERT ... ON CONFLICT (index_elements) DO UPDATE SET update_columns
+    rows is a list of dicts. Works on Postgres and SQLite.
+    """
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    stmt = insert(model).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: stmt.excluded[column] for column in update_columns}
+    )
+    db.session.execute(stmt)
+
+def _stat_row(room_id, day):
     return {
-        'pending_count': pending,
-        'approved_count': approved,
-        'total_requests': pending + approved
+        'room_id': room_id,
+        'day': day,
+        'pending_count': 0,
+        'approved_count': 0,
+        'declined_count': 0,
+        'expired_count': 0,
+        'booked_minutes': 0
     }
 
-def mark_completed_bookings():
+def _count_into(stats, room_id, day, status, approve_by, start_time, end_time):
+    row = stats.setdefault((room_id, day), _stat_row(room_id, day))
+    row[f'{status.lower()}_count'] += 1
+    # Approved bookings that already ran get Expired by the sweeper; they keep
+    # approve_by, which is how they differ from Pending requests that expired.
+    if status == 'Approved' or (status == 'Expired' and approve_by):
+        row['booked_minutes'] += int((end_time - start_time).total_seconds() // 60)
+
+def _status_text(model):
+    # reserves.status is an enum, reserves_archive.status text: Postgres won't UNION them as they are
+    return cast(model.status, db.String).label('status')
+
+STAT_COLUMNS = ['pending_count', 'approved_count', 'declined_count', 'expired_count', 'booked_minutes']
+
+def refresh_room_day_stats(room_days):
+    """
+    Recompute the rollup rows for the given (room_id, day) pairs
+    One query over the (room_id, book_date) index + one upsert.
+    """
+    room_days = list(room_days)
+    if not room_days:
+        return
+    stats = {key: _stat_row(*key) for key in room_days}
+
+    rows = db.session.execute(union_all(*[
+        select(model.room_id, model.book_date, _status_text(model), model.approve_by,
+               model.start_time, model.end_time)
+        .where(tuple_(model.room_id, model.book_date).in_(room_days))
+        for model in (Reserve, ReserveArchive)
+    ]))
+    for row in rows:
+        _count_into(stats, *row)
+
+    upsert(RoomDayStat, list(stats.values()), ['room_id', 'day'], STAT_COLUMNS)
+
+@event.listens_for(Session, 'before_commit')
+def _refresh_stats_before_commit(session):
+    room_days = session.info.pop('room_days_dirty', None)
+    if room_days:
+        refresh_room_day_stats(room_days)
+    versions = session.info.pop('versions_dirty', None)
+    if versions:
+        bump_versions(versions)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stats_after_rollback(session):
+    session.info.pop('room_days_dirty', None)
+    session.info.pop('versions_dirty', None)
+
+def rebuild_room_day_stats(batch_size=1000):
+    """
+    Rebuild the whole rollup from reserves and the archive (backfill / repair)
+    Streams both tables once; memory grows with room-days, not bookings.
+    Returns the number of rollup rows written.
+    """
+    stats = {}
+    rows = db.session.execute(
+        union_all(*[
+            select(model.room_id, model.book_date, _status_text(model), model.approve_by,
+                   model.start_time, model.end_time)
+            for model in (Reserve, ReserveArchive)
+        ]).execution_options(yield_per=batch_size)
+    )
+    for row in rows:
+        _count_into(stats, *row)
+
+    db.session.query(RoomDayStat).delete(synchronize_session=False)
+    values = list(stats.values())
+    for i in range(0, len(values), batch_size):
+        upsert(RoomDayStat, values[i:i + batch_size], ['room_id', 'day'], STAT_COLUMNS)
+    db.session.commit()
+    return len(values)
+
+def get_room_statistics_range(room_ids, start_date, end_date):
     """
-    Mark past bookings as completed
-    Should be run periodically (e.g., daily cron job)
+    Get booking statistics for many rooms over a date range in ONE query
+    Reads the room_day_stats rollup, never scans reserves.
+    Returns {(room_id, day): {pending_count, approved_count, declined_count,
+             expired_count, booked_minutes, total_requests}}; days with no
+             bookings are left out.
     """
-    now = datetime.utcnow()
+    query = RoomDayStat.query.filter(
+        RoomDayStat.day >= start_date,
+        RoomDayStat.day <= end_date
+    )
+    if room_ids is not None:
+        query = query.filter(RoomDayStat.room_id.in_(list(room_ids)))
+
+    stats = {}
+    for row in query:
+        stats[(row.room_id, row.day)] = {
+            'pending_count': row.pending_count,
+            'approved_count': row.approved_count,
+            'declined_count': row.declined_count,
+            'expired_count': row.expired_count,
+            'booked_minutes': row.booked_minutes,
+            'total_requests': row.pending_count + row.approved_count
+        }
+    return stats
+
+def get_room_statistics(room_id, date):
+    """
+    Get booking statistics for a room on a specific date
+    Returns dict with pending_count and approved_count
+    """
+    stats = get_room_statistics_range([room_id], date, date).get((room_id, date))
+    if stats is None:
+        return {
+            'pending_count': 0,
+            'approved_count': 0,
+            'total_requests': 0
+        }
+    return stats
+
+def archive_reservations_batch(cutoff, batch_size=1000):
+    """
+    Move one batch of terminal reservations that ended before cutoff
+    INSERT ... SELECT into reserves_archive and DELETE from reserves in the
+    same transaction, oldest reserve_id first, so an interrupted run just
+    continues where it stopped. Caller commits.
+    Returns the number of rows moved (0 when there is nothing left)
+    """
+    batch = db.session.execute(
+        select(Reserve.reserve_id, Reserve.reserve_by)
+        .where(Reserve.status.in_(ARCHIVE_STATUSES), Reserve.end_time < cutoff)
+        .order_by(Reserve.reserve_id)
+        .limit(batch_size)
+    ).all()
+    if not batch:
+        return 0
+    ids = [row.reserve_id for row in batch]
+
+    columns = [column.name for column in Reserve.__table__.columns]
+    db.session.execute(
+        insert(ReserveArchive).from_select(
+            columns + ['archived_at'],
+            select(*[Reserve.__table__.c[name] for name in columns], literal(datetime.utcnow()))
+            .where(Reserve.reserve_id.in_(ids))
+        )
+    )
+    db.session.execute(
+        delete(Reserve).where(Reserve.reserve_id.in_(ids))
+        .execution_options(synchronize_session=False)
+    )
+    # Rows left the live lists (history API, approval tabs); the rollup already
+    # counts the archive, so it needs no refresh
+    bump_versions({f'user:{row.reserve_by}' for row in batch} | {'pending'})
+    return len(ids)
+
+def archive_reservations(cutoff, batch_size=1000, max_batches=None, progress=None):
+    """
+    Archive terminal reservations that ended before cutoff, one commit per batch
+    progress(moved_so_far) is called after every batch.
+    Returns the total number of rows moved
+    """
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_reservations_batch(cutoff, batch_size)
+        db.session.commit()
+        if not moved:
+            break
+        total += moved
+        batches += 1
+        if progress:
+            progress(total)
+    return total
+
+# History tabs: name -> statuses shown (stale Pending rows count as Expired)
+HISTORY_TABS = ('all', 'pending', 'approved', 'declined', 'expired')
+
+def _history_status(now):
+    # Status as the history page shows it: Pending past its end reads Expired
+    return case(
+        (and_(Reserve.status == 'Pending', Reserve.end_time < now), 'Expired'),
+        else_=Reserve.status
+    )
+
+def get_user_bookings(username, tab='all', now=None, before_id=None, limit=20):
+    """
+    Get one page of a user's live reservations for a history tab, newest first
+    Served by the (reserve_by, reserve_id) index; approver names are joined.
+    Returns (bookings, next_before) like get_approval_queue
+    """
+    if now is None:
+        now = datetime.now()
+    query = Reserve.query.options(joinedload(Reserve.approver)).filter(Reserve.reserve_by == username)
+    if tab == 'pending':
+        query = query.filter(Reserve.status == 'Pending', Reserve.end_time >= now)
+    elif tab == 'expired':
+        query = query.filter(or_(Reserve.status == 'Expired',
+                                 and_(Reserve.status == 'Pending', Reserve.end_time < now)))
+    elif tab in ('approved', 'declined'):
+        query = query.filter(Reserve.status == tab.capitalize())
+    if before_id:
+        query = query.filter(Reserve.reserve_id < before_id)
+    bookings = query.order_by(Reserve.reserve_id.desc()).limit(limit + 1).all()
+
+    next_before = None
+    if len(bookings) > limit:
+        bookings = bookings[:limit]
+        next_before = bookings[-1].reserve_id
+    return bookings, next_before
+
+def get_user_status_counts(username, now=None):
+    """
+    Count a user's live reservations per history tab with ONE grouped query
+    Returns {'all': n, 'pending': n, 'approved': n, 'declined': n, 'expired': n}
+    """
+    if now is None:
+        now = datetime.now()
+    # Grouped through a subquery: Postgres won't match a GROUP BY expression
+    # with bind parameters against the same expression in the select list
+    rows = select(_history_status(now).label('shown')).where(Reserve.reserve_by == username).subquery()
+    counts = dict.fromkeys(HISTORY_TABS, 0)
+    for shown, count in db.session.query(rows.c.shown, func.count()).group_by(rows.c.shown):
+        counts[shown.lower()] = count
+        counts['all'] += count
+    return counts
+
+def get_archived_bookings(username, before_id=None, limit=20):
+    """
+    Get one page of a user's archived reservations, newest first
+    Returns (bookings, next_before) like get_approval_queue
+    """
+    query = ReserveArchive.query.options(joinedload(ReserveArchive.approver)) \
+        .filter(ReserveArchive.reserve_by == username)
+    if before_id:
+        query = query.filter(ReserveArchive.reserve_id < before_id)
+    bookings = query.order_by(ReserveArchive.reserve_id.desc()).limit(limit + 1).all()
+
+    next_before = None
+    if len(bookings) > limit:
+        bookings = bookings[:limit]
+        next_before = bookings[-1].reserve_id
+    return bookings, next_before
+
+def mark_completed_bookings(now=None):
+    """
+    Expire every Pending or Approved booking whose end time has passed
+    Runs as ONE set-based UPDATE (served by the status/end_time index)
+    after locking the rooms it touches, like every other review path: the
+    room/day rollup is recounted inside the commit, and without the locks
+    a concurrent approval on the same room/day could commit unseen by it.
+    Should be run periodically (see app/sweeper.py)
+    Returns the number of rows changed
+    """
+    if now is None:
+        now = datetime.now()
     
-    expired = Reserve.query.filter(
-        Reserve.status == 'Approved',
-        Reserve.end_time < now
-    ).update({'status': 'Expired'})
+    due = and_(Reserve.status.in_(['Pending', 'Approved']), Reserve.end_time < now)
+    lock_reservation_rooms(due)
+    expired = db.session.execute(
+        update(Reserve)
+        .where(due)
+        .values(status='Expired')
+        .returning(*CHANGED_COLUMNS)
+        .execution_options(synchronize_session=False)
+    ).all()
     
-    return expired
+    record_reservation_changes(expired)
+    return len(expired)
 
 def validate_booking_time(start_time, end_time):
     """
@@ -0,0 +1,64 @@
+"""
+Compare two benchmark result files
+
+    python -m benchmarks.compare before.json after.json [--threshold 10]
+
+Prints p50/p95 latency and queries per call side by side. Exits with
+status 1 if any scenario's p50 got slower by more than --threshold percent
+or now issues more queries per call.
+"""
+import argparse
+import json
+import sys
+
+METRICS = ('p50_ms', 'p95_ms', 'queries_mean')
+
+
+def _change(old, new):
+    if old in (None, 0) or new is None:
+        return None
+    return 100.0 * (new - old) / old
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark runs')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='allowed p50 slowdown in percent')
+    args = parser.parse_args(argv)
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f"before: {before['meta'].get('commit')}  after: {after['meta'].get('commit')}")
+    print(f"{'scenario':<28}" + ''.join(f'{m:>26}' for m in METRICS))
+
+    regressions = []
+    for name, new in after['results'].items():
+        old = before['results'].get(name)
+        if not old:
+            continue
+        cells = []
+        for metric in METRICS:
+            change = _change(old.get(metric), new.get(metric))
+            delta = f' ({change:+.1f}%)' if change is not None else ''
+            cells.append(f"{old.get(metric, '-')} -> {new.get(metric, '-')}{delta}")
+        print(f'{name:<28}' + ''.join(f'{cell:>26}' for cell in cells))
+
+        slower = _change(old.get('p50_ms'), new.get('p50_ms'))
+        if slower is not None and slower > args.threshold:
+            regressions.append(f'{name}: p50 {slower:+.1f}%')
+        if new.get('queries_mean', 0) > old.get('queries_mean', 0):
+            regressions.append(f"{name}: queries {old.get('queries_mean')} -> {new.get('queries_mean')}")
+
+    if regressions:
+        print('\nRegressions:\n  ' + '\n  '.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
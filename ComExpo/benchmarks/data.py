@@ -0,0 +1,132 @@
+"""
+Synthetic data for the benchmark suite
+
+Seeds rooms, users and reservations with realistic contention: a few rooms
+are much more popular than the rest, requests cluster in teaching hours and
+many Pending requests overlap. Approved bookings never overlap each other
+(the Postgres exclusion constraint would reject them).
+"""
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+from app import db
+from app.cache import bump_version
+from app.models import Reserve, Room, User
+from app.utils import decline_pending_overlapping, rebuild_room_day_stats
+
+BENCH_PASSWORD = 'bench'
+CHUNK_SIZE = 5000
+
+
+def student_name(i):
+    return f'bench-student-{i}@mail.kmutt.ac.th'
+
+
+def professor_name(i):
+    return f'bench-prof-{i}@kmutt.ac.th'
+
+
+def room_name(i):
+    return f'BR-{i:04d}'
+
+
+def _chunks(rows):
+    for i in range(0, len(rows), CHUNK_SIZE):
+        yield rows[i:i + CHUNK_SIZE]
+
+
+def seed(rooms=20, students=500, professors=10, reservations=10000, days=60, random_seed=42):
+    """
+    Create a fresh schema and fill it
+    Reservations are spread over `days` days centred on today.
+    Returns a dict with the row counts written.
+    """
+    rng = random.Random(random_seed)
+    db.drop_all()
+    db.create_all()
+
+    # One hash for every user: hashing 100k passwords would dominate seeding
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    today = datetime.utcnow().date()
+
+    room_rows = [{
+        'room_id': room_name(i),
+        'chair': rng.choice([30, 40, 50, 60, 80]),
+        'projector': rng.random() < 0.9,
+        'air_conditioner': rng.randint(1, 4),
+        'computer': rng.random() < 0.3
+    } for i in range(rooms)]
+    db.session.execute(insert(Room), room_rows)
+
+    user_rows = [{
+        'username': student_name(i), 'name': f'Student {i}', 'role': 'Student',
+        'hash_password': password_hash, 'std_id': f'{66070000000 + i}'[:11], 'register_date': today
+    } for i in range(students)]
+    user_rows += [{
+        'username': professor_name(i), 'name': f'Professor {i}', 'role': 'Professor',
+        'hash_password': password_hash, 'std_id': None, 'register_date': today
+    } for i in range(professors)]
+    for chunk in _chunks(user_rows):
+        db.session.execute(insert(User), chunk)
+
+    # Zipf-like room popularity and a long tail of light users
+    room_weights = [1 / (i + 1) for i in range(rooms)]
+    student_weights = [1 / (i + 1) ** 0.5 for i in range(students)]
+    room_ids = [row['room_id'] for row in room_rows]
+    student_ids = [row['username'] for row in user_rows[:students]]
+    now = datetime.now()
+    first_day = today - timedelta(days=days // 2)
+
+    approved = {}  # (room_id, day) -> [(start, end)]
+    reserve_rows = []
+    for n in range(reservations):
+        room_id = rng.choices(room_ids, room_weights)[0]
+        day = first_day + timedelta(days=rng.randrange(days))
+        start = datetime.combine(day, datetime.min.time()) + timedelta(
+            minutes=rng.choice(range(8 * 60, 19 * 60, 30)))
+        end = start + timedelta(minutes=rng.choice([60, 90, 120, 180]))
+
+        roll = rng.random()
+        if roll < 0.25:
+            status = 'Approved'
+        elif roll < 0.35:
+            status = 'Declined'
+        else:
+            status = 'Pending'
+
+        if status == 'Approved':
+            taken = approved.setdefault((room_id, day), [])
+            if any(s < end and e > start for s, e in taken):
+                status = 'Declined'
+            else:
+                taken.append((start, end))
+        reviewed = status in ('Approved', 'Declined')
+        if end < now and status in ('Pending', 'Approved'):
+            status = 'Expired'  # what the sweeper would have done
+
+        professor = professor_name(rng.randrange(professors)) if reviewed else None
+        reserve_rows.append({
+            'room_id': room_id,
+            'book_date': day,
+            'start_time': start,
+            'end_time': end,
+            'reason': 'Benchmark booking',
+            'reserve_by': rng.choices(student_ids, student_weights)[0],
+            'status': status,
+            'approve_by': professor,
+            'approve_date': today if reviewed else None
+        })
+        # Insert as we go so 1M rows never sit in memory at once
+        if len(reserve_rows) == CHUNK_SIZE or n == reservations - 1:
+            db.session.execute(insert(Reserve), reserve_rows)
+            db.session.commit()
+            reserve_rows = []
+
+    # Approving would have declined overlapping Pending requests: do it in one UPDATE
+    decline_pending_overlapping(lambda approved: approved.status == 'Approved', professor_name(0))
+    bump_version('rooms')
+    db.session.commit()
+    rebuild_room_day_stats()
+
+    return {'rooms': rooms, 'users': len(user_rows), 'reservations': reservations}
@@ -0,0 +1,455 @@
+"""
+Benchmark runner
+
+Builds create_app() against the database in --database-url, seeds it with
+benchmarks/data.py and times the main routes and booking utilities through
+the Flask test client (no network, so numbers are app + database time).
+Every scenario reports latency percentiles and SQL statements per call.
+Scenarios that check an invariant (no overlapping approvals, a large
+cascade commits, ...) make the run exit non-zero when it does not hold.
+
+    cd ComExpo
+    python -m benchmarks.run --database-url sqlite:////tmp/bench.db \\
+        --reservations 100000 --output results.json
+    python -m benchmarks.compare before.json results.json
+
+The target database is dropped and recreated unless --skip-seed is given.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+SCENARIOS = ('new_booking_get', 'new_booking_post', 'pending_requests', 'my_bookings',
+             'approve', 'decline', 'cascade_decline_conflicts', 'concurrent_approve', 'room_locking',
+             'large_cascade')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the booking app')
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL', 'sqlite:////tmp/bench.db'))
+    parser.add_argument('--rooms', type=int, default=20)
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--professors', type=int, default=10)
+    parser.add_argument('--reservations', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=60, help='days the reservations are spread over')
+    parser.add_argument('--repeat', type=int, default=50, help='calls per scenario')
+    parser.add_argument('--concurrency', type=int, default=4, help='threads in concurrent_approve')
+    parser.add_argument('--cascade-size', type=int, default=300, help='requests declined at once in large_cascade')
+    parser.add_argument('--only', default='', help='comma-separated scenario names')
+    parser.add_argument('--skip-seed', action='store_true', help='reuse the data already in the database')
+    parser.add_argument('--random-seed', type=int, default=42)
+    parser.add_argument('--output', help='write JSON results here (default: stdout)')
+    return parser.parse_args(argv)
+
+
+class QueryCounter:
+    """Counts SQL statements per thread through an engine event"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+
+def summarize(samples, statuses=None):
+    """Latency/query summary for a list of (elapsed_ms, queries)"""
+    if not samples:
+        return {'n': 0}
+    times = sorted(ms for ms, _ in samples)
+    queries = [q for _, q in samples]
+
+    def pct(p):
+        return round(times[min(len(times) - 1, int(p * (len(times) - 1) + 0.5))], 3)
+
+    summary = {
+        'n': len(samples),
+        'mean_ms': round(sum(times) / len(times), 3),
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'max_ms': round(times[-1], 3),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries)
+    }
+    if statuses:
+        summary['status_codes'] = {str(code): statuses.count(code) for code in sorted(set(statuses))}
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Bench:
+    def __init__(self, app, counter, args):
+        self.app = app
+        self.counter = counter
+        self.args = args
+        self.rng = random.Random(args.random_seed)
+        self.failures = []
+
+    def expect(self, scenario, ok, message):
+        """Record a failed invariant; main() exits non-zero if any were recorded"""
+        if not ok:
+            self.failures.append(f'{scenario}: {message}')
+
+    def client(self, username):
+        from benchmarks.data import BENCH_PASSWORD
+        client = self.app.test_client()
+        response = client.post('/login', data={'email': username, 'password': BENCH_PASSWORD})
+        if response.status_code != 302:
+            raise RuntimeError(f'login failed for {username}')
+        return client
+
+    def time_calls(self, calls):
+        """Run each zero-arg callable once; returns the summary"""
+        samples, statuses = [], []
+        for call in calls:
+            self.counter.reset()
+            started = time.perf_counter()
+            status = call()
+            samples.append(((time.perf_counter() - started) * 1000, self.counter.count))
+            if status is not None:
+                statuses.append(status)
+        return summarize(samples, statuses)
+
+    def future_pending_ids(self, limit, room_id=None):
+        from app import db
+        from app.models import Reserve
+        with self.app.app_context():
+            query = db.session.query(Reserve.reserve_id).filter(
+                Reserve.status == 'Pending', Reserve.start_time > datetime.now())
+            if room_id:
+                query = query.filter(Reserve.room_id == room_id)
+            ids = [reserve_id for (reserve_id,) in query.order_by(Reserve.reserve_id).limit(limit * 4)]
+        self.rng.shuffle(ids)
+        return ids[:limit]
+
+    # --- scenarios ---
+
+    def new_booking_get(self, student, professor):
+        return self.time_calls([lambda: student.get('/booking/new').status_code] * self.args.repeat)
+
+    def new_booking_post(self, student, professor):
+        from benchmarks.data import room_name
+
+        def book():
+            day = datetime.now().date() + timedelta(days=self.rng.randint(10, 40))
+            start = self.rng.choice(range(8, 19))
+            return student.post('/booking/new', data={
+                'room_id': room_name(self.rng.randrange(self.args.rooms)),
+                'date': day.strftime('%Y-%m-%d'),
+                'start_time': f'{start:02d}:00',
+                'end_time': f'{start + 1:02d}:00',
+                'reason': 'Benchmark booking'
+            }).status_code
+        return self.time_calls([book] * self.args.repeat)
+
+    def pending_requests(self, student, professor):
+        return self.time_calls([lambda: professor.get('/approval/pending').status_code] * self.args.repeat)
+
+    def my_bookings(self, student, professor):
+        return self.time_calls([lambda: student.get('/history/my-bookings').status_code] * self.args.repeat)
+
+    def approve(self, student, professor):
+        return self.time_calls([
+            (lambda reserve_id=reserve_id: professor.post(f'/approval/approve/{reserve_id}').status_code)
+            for reserve_id in self.future_pending_ids(self.args.repeat)
+        ])
+
+    def decline(self, student, professor):
+        return self.time_calls([
+            (lambda reserve_id=reserve_id: professor.post(f'/approval/decline/{reserve_id}').status_code)
+            for reserve_id in self.future_pending_ids(self.args.repeat)
+        ])
+
+    def cascade_decline_conflicts(self, student, professor):
+        # The utility alone, rolled back each time so the data doesn't drift
+        from app import db
+        from app.models import Reserve
+        from app.utils import cascade_decline_conflicts
+        from benchmarks.data import professor_name
+
+        samples = []
+        with self.app.app_context():
+            for reserve_id in self.future_pending_ids(self.args.repeat):
+                reservation = db.session.get(Reserve, reserve_id)
+                reservation.status = 'Approved'
+                reservation.approve_by = professor_name(0)
+                self.counter.reset()
+                started = time.perf_counter()
+                cascade_decline_conflicts(reservation)
+                samples.append(((time.perf_counter() - started) * 1000, self.counter.count))
+                db.session.rollback()
+        return summarize(samples)
+
+    def concurrent_approve(self, student, professor):
+        """
+        Professors approve overlapping requests for the busiest room at once
+        Reports throughput, per-request latency and whether any two Approved
+        bookings ended up overlapping (must be 0).
+        """
+        from benchmarks.data import professor_name, room_name
+        room_id = room_name(0)
+        ids = self.future_pending_ids(self.args.repeat * self.args.concurrency, room_id=room_id)
+        workers = min(self.args.concurrency, self.args.professors)
+        clients = [self.client(professor_name(i)) for i in range(workers)]
+        batches = [ids[i::workers] for i in range(workers)]
+        results = [[] for _ in range(workers)]
+        barrier = threading.Barrier(workers)
+
+        def work(index):
+            client = clients[index]
+            barrier.wait()
+            for reserve_id in batches[index]:
+                started = time.perf_counter()
+                try:
+                    status = client.post(f'/approval/approve/{reserve_id}').status_code
+                except Exception:
+                    status = 'error'
+                results[index].append(((time.perf_counter() - started) * 1000, status))
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_s = time.perf_counter() - started
+
+        flat = [item for batch in results for item in batch]
+        summary = summarize([(ms, 0) for ms, _ in flat], [status for _, status in flat])
+        summary.pop('queries_mean', None)
+        summary.pop('queries_max', None)
+        summary.update({
+            'threads': workers,
+            'wall_s': round(wall_s, 3),
+            'throughput_rps': round(len(flat) / wall_s, 2) if wall_s else None,
+            'overlapping_approved': self.overlapping_approved(room_id)
+        })
+        self.expect('concurrent_approve', summary['overlapping_approved'] == 0,
+                    f"{summary['overlapping_approved']} overlapping Approved bookings")
+        return summary
+
+    def room_locking(self, student, professor):
+        """
+        Professors auto-approve the same free slot at once, first all in one
+        room, then each in a different room
+        same_room_approved must be 1 (the per-room lock serializes them) and
+        different_rooms_approved must equal threads (nothing blocks them);
+        the run fails otherwise. The second phase leaves out the first
+        phase's room. Compare the two wall times for how much one room's
+        lock costs.
+        """
+        from benchmarks.data import professor_name, room_name
+        workers = min(self.args.concurrency, self.args.professors, self.args.rooms - 1)
+        clients = [self.client(professor_name(i)) for i in range(workers)]
+        # Before teaching hours and past the seeded range: the slot starts free
+        day = datetime.now().date() + timedelta(days=self.args.days + self.rng.randint(1, 300))
+
+        def run(phase, rooms):
+            barrier = threading.Barrier(workers)
+            statuses = [None] * workers
+
+            def work(index):
+                barrier.wait()
+                try:
+                    statuses[index] = clients[index].post('/booking/new', data={
+                        'room_id': rooms[index],
+                        'date': day.strftime('%Y-%m-%d'),
+                        'start_time': '05:00',
+                        'end_time': '06:00',
+                        'reason': f'room_locking {phase}'
+                    }).status_code
+                except Exception:
+                    statuses[index] = 'error'
+
+            threads = [threading.Thread(target=work, args=(i,)) for i in range(workers)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            return round(time.perf_counter() - started, 3), statuses
+
+        same_wall, same_statuses = run('same', [room_name(0)] * workers)
+        different_wall, different_statuses = run('different', [room_name(i + 1) for i in range(workers)])
+        statuses = [str(status) for status in same_statuses + different_statuses]
+        summary = {
+            'threads': workers,
+            'same_room_wall_s': same_wall,
+            'same_room_approved': self.approved_for('room_locking same', day),
+            'different_rooms_wall_s': different_wall,
+            'different_rooms_approved': self.approved_for('room_locking different', day),
+            'status_codes': {code: statuses.count(code) for code in sorted(set(statuses))},
+            'overlapping_approved': self.overlapping_approved(room_name(0))
+        }
+        self.expect('room_locking', summary['same_room_approved'] == 1,
+                    f"{summary['same_room_approved']} approved in the same room, expected 1")
+        self.expect('room_locking', summary['different_rooms_approved'] == workers,
+                    f"{summary['different_rooms_approved']} approved in different rooms, expected {workers}")
+        self.expect('room_locking', summary['overlapping_approved'] == 0,
+                    f"{summary['overlapping_approved']} overlapping Approved bookings")
+        return summary
+
+    def large_cascade(self, student, professor):
+        """
+        A professor books the slot --cascade-size Pending requests are waiting for
+        The booking is auto-approved and declines all of them in one commit,
+        which publishes one event per row (Postgres NOTIFY payloads are
+        limited to 8000 bytes). It must commit and leave every request Declined.
+        """
+        from sqlalchemy import func, insert
+        from app import db
+        from app.models import Reserve
+        from app.utils import record_reservation_changes
+        from benchmarks.data import room_name, student_name
+        size = self.args.cascade_size
+        room_id = room_name(0)
+        day = datetime.now().date() + timedelta(days=self.args.days + self.rng.randint(1, 300))
+        start = datetime.combine(day, datetime.min.time()) + timedelta(hours=6)
+
+        with self.app.app_context():
+            requests = db.session.execute(
+                insert(Reserve).returning(Reserve.reserve_id, Reserve.room_id, Reserve.book_date,
+                                          Reserve.start_time, Reserve.end_time, Reserve.reserve_by,
+                                          Reserve.status),
+                [{
+                    'room_id': room_id,
+                    'book_date': day,
+                    'start_time': start,
+                    'end_time': start + timedelta(hours=1),
+                    'reason': 'large_cascade request',
+                    'reserve_by': student_name(i % self.args.students),
+                    'status': 'Pending'
+                } for i in range(size)]
+            ).all()
+            record_reservation_changes(requests)
+            db.session.commit()
+
+        self.counter.reset()
+        started = time.perf_counter()
+        status = professor.post('/booking/new', data={
+            'room_id': room_id,
+            'date': day.strftime('%Y-%m-%d'),
+            'start_time': '06:00',
+            'end_time': '07:00',
+            'reason': 'large_cascade'
+        }).status_code
+        summary = summarize([((time.perf_counter() - started) * 1000, self.counter.count)], [status])
+
+        with self.app.app_context():
+            declined = db.session.query(func.count()).filter(
+                Reserve.reason == 'large_cascade request', Reserve.book_date == day,
+                Reserve.status == 'Declined'
+            ).scalar()
+        summary.update({
+            'requests': size,
+            'approved': self.approved_for('large_cascade', day),
+            'declined': declined
+        })
+        self.expect('large_cascade', summary['approved'] == 1 and declined == size,
+                    f'booking approved {summary["approved"]} time(s), {declined} of {size} requests declined')
+        return summary
+
+    def approved_for(self, reason, day):
+        from sqlalchemy import func
+        from app import db
+        from app.models import Reserve
+        with self.app.app_context():
+            return db.session.query(func.count()).filter(
+                Reserve.reason == reason, Reserve.book_date == day, Reserve.status == 'Approved'
+            ).scalar()
+
+    def overlapping_approved(self, room_id):
+        from sqlalchemy import func
+        from sqlalchemy.orm import aliased
+        from app import db
+        from app.models import Reserve
+        a, b = aliased(Reserve), aliased(Reserve)
+        with self.app.app_context():
+            return db.session.query(func.count()).select_from(a).join(
+                b, (a.room_id == b.room_id) & (a.reserve_id < b.reserve_id)
+                & (a.start_time < b.end_time) & (a.end_time > b.start_time)
+            ).filter(a.room_id == room_id, a.status == 'Approved', b.status == 'Approved').scalar()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    # Timings only: the in-process sweeper would change the data between scenarios
+    os.environ.setdefault('EXPIRY_SWEEP_INTERVAL', '0')
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from app import create_app, db
+    from benchmarks.data import seed, student_name, professor_name
+
+    app = create_app()
+    dataset = None
+    with app.app_context():
+        if not args.skip_seed:
+            started = time.perf_counter()
+            dataset = seed(args.rooms, args.students, args.professors,
+                           args.reservations, args.days, args.random_seed)
+            dataset['seed_s'] = round(time.perf_counter() - started, 2)
+        counter = QueryCounter(db.engine)
+        dialect = db.engine.dialect.name
+
+    bench = Bench(app, counter, args)
+    # student 0 is the heaviest booker, professor 0 does the single-thread reviews
+    student = bench.client(student_name(0))
+    professor = bench.client(professor_name(0))
+
+    selected = [name for name in args.only.split(',') if name] or list(SCENARIOS)
+    results = {}
+    for name in selected:
+        if name not in SCENARIOS:
+            raise SystemExit(f'unknown scenario {name!r}; choose from {", ".join(SCENARIOS)}')
+        results[name] = getattr(bench, name)(student, professor)
+        print(f'{name}: {results[name]}', file=sys.stderr)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'python': platform.python_version(),
+            'dialect': dialect,
+            'dataset': dataset or 'existing',
+            'repeat': args.repeat,
+            'concurrency': args.concurrency
+        },
+        'results': results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if bench.failures:
+        raise SystemExit('FAILED\n' + '\n'.join(bench.failures))
+
+
+if __name__ == '__main__':
+    main()